@@ -15,12 +15,27 @@ DEFAULT_OWNER = os.getenv("DEFAULT_OWNER", "mkk")
 USE_TARGETS = os.getenv("USE_TARGETS", "True").lower() == "true"
 USE_NORDNET_PORTFOLIO = os.getenv("USE_NORDNET_PORTFOLIO", "True").lower() == "true"
 LOG_FILE = os.getenv("LOG_FILE", None)
+READ_WORKERS = int(os.getenv("READ_WORKERS", "1"))
+CSV_ENGINE = os.getenv("CSV_ENGINE", "c").lower()
+USE_PARSE_CACHE = os.getenv("USE_PARSE_CACHE", "True").lower() == "true"
+CATEGORIZATION_ENGINE = os.getenv("CATEGORIZATION_ENGINE", "compiled").lower()
+CATEGORIZE_WORKERS = int(os.getenv("CATEGORIZE_WORKERS", "1"))
+RULE_TIME_BUDGET = float(os.getenv("RULE_TIME_BUDGET", "1.0"))
+USE_CATEGORIZATION_MEMO = os.getenv("USE_CATEGORIZATION_MEMO", "True").lower() == "true"
 
 # other settings
 PREPROCESSORS_FOLDER = os.path.join(DATA_FOLDER, "source_files/for_preprocessors")
+CACHE_FOLDER = os.path.join(DATA_FOLDER, "cache")
 SETTINGS = {
     # app settings
     "default_owner": DEFAULT_OWNER,
+    "read_workers": READ_WORKERS,
+    "csv_engine": CSV_ENGINE,
+    "use_parse_cache": USE_PARSE_CACHE,
+    "categorization_engine": CATEGORIZATION_ENGINE,
+    "categorize_workers": CATEGORIZE_WORKERS,
+    "use_categorization_memo": USE_CATEGORIZATION_MEMO,
+    "rule_time_budget": RULE_TIME_BUDGET,
     # data
     "data_folder": DATA_FOLDER,
     "source_folder": os.path.join(DATA_FOLDER, "source_files"),
@@ -29,6 +44,7 @@ SETTINGS = {
         DATA_FOLDER, "intermediate/categorization_changes"
     ),
     "duplicates_folder": os.path.join(DATA_FOLDER, "intermediate/duplicates"),
+    "rule_profile_file": os.path.join(DATA_FOLDER, "intermediate/4_rule_profile.csv"),
     "final_result_folder": os.path.join(DATA_FOLDER, "final"),
     "final_result_file": os.path.join(DATA_FOLDER, "final/final_data.csv"),
     # config
@@ -40,6 +56,13 @@ SETTINGS = {
     "splits_file": os.path.join(CONFIG_FOLDER, "data_processing/splits.csv"),
     "use_targets": USE_TARGETS,
     "targets_file": os.path.join(CONFIG_FOLDER, "data_processing/targets.csv"),
+    # cache
+    "cache_folder": CACHE_FOLDER,
+    "encoding_cache_file": os.path.join(CACHE_FOLDER, "encodings.json"),
+    "config_registry_cache_file": os.path.join(CACHE_FOLDER, "config_registry.json"),
+    "file_hash_cache_file": os.path.join(CACHE_FOLDER, "file_hashes.json"),
+    "parse_cache_folder": os.path.join(CACHE_FOLDER, "parsed"),
+    "categorization_memo_folder": os.path.join(CACHE_FOLDER, "categorization"),
     # debug
     "debug_folder": os.path.join(DATA_FOLDER, "intermediate/debug"),
     "debug_mode": False,
@@ -0,0 +1,1056 @@
+import hashlib
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from config.settings import SETTINGS
+from data_pipeline.src.utils.cache import frame_cache_path, load_frame, save_frame
+
+# rule columns matched against the same dataframe column with a regex
+TEXT_COLUMNS = ["account", "description", "info"]
+# columns the rules read, rows with the same values get the same result
+KEY_COLUMNS = TEXT_COLUMNS + ["sign"]
+# rule value matching any text, see validate_categories
+MATCH_ALL = ".*"
+# amount conditions of the rules as amount sign codes
+SIGN_CODES = {"pos": 1, "neg": -1, "zero": 0}
+# match paths of the rule patterns, from fastest to slowest
+PATTERN_KINDS = ["literal", "anchored", "regex"]
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+# characters outside latin-1 and latin extended-a, and the three in it, where
+# str.lower() doesn't match like a case insensitive regex. texts and patterns
+# containing them use the regex engine
+NOT_LOWER_SAFE = re.compile("[^\x01-\u017f]|[\u0130\u0131\u017f]")
+# quantifier after a character, class or group: *, + or {m,n}
+QUANTIFIER = re.compile(r"[*+]|\{\d*,?\d*\}")
+# unbounded wildcards, several of them in one pattern backtrack polynomially
+WILDCARD = re.compile(r"(?<!\\)\.[*+]")
+MAX_WILDCARDS = 2
+# separates the distinct values of a column in the searched text
+SEPARATOR = "\x00"
+# bump when the rule evaluation changes, invalidates saved categorization memos
+MEMO_VERSION = 1
+# names of the memo and rules files saved by save_memo
+MEMO_FILE = re.compile(r"(memo|rules)_([0-9a-f]{64})\.(parquet|pkl)")
+# smallest shard evaluated in its own process, smaller inputs are evaluated serially
+MIN_SHARD_ROWS = 5000
+# compiled rules of a categorization worker process, set once by init_worker
+_worker_rules = None
+# last categorization memo by memo folder, reused between categorization runs
+_memos = {}
+# rule columns assigned to the categorized rows
+RESULT_COLUMNS = {
+    "rule_id": "id",
+    "class": "class",
+    "category": "category",
+    "sub_category": "sub_category",
+}
+
+
+def regex_risks(pattern: str) -> list:
+    """
+    checks a rule pattern for constructs that can make the regex engine backtrack
+    for a very long time on long texts: a quantified group containing a quantifier,
+    like (a+)+ or (\\w+\\s?)*, and many unbounded wildcards.
+
+    :param pattern: pattern from the rules.
+    :return: list of risky constructs found, empty if none.
+    """
+    risks = []
+    # one flag per open group: the group contains a quantifier
+    groups = [False]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            # skip the character class, a ] right after [ or [^ is a literal
+            end = i + 1
+            if pattern[end : end + 1] == "^":
+                end += 1
+            if pattern[end : end + 1] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            i = end + 1
+            continue
+
+        quantifier = QUANTIFIER.match(pattern, i)
+        if char == "(":
+            groups.append(False)
+        elif char == ")" and len(groups) > 1:
+            inner = groups.pop()
+            quantified = QUANTIFIER.match(pattern, i + 1) is not None
+            if inner and quantified and "nested quantifier" not in risks:
+                risks.append("nested quantifier")
+            groups[-1] = groups[-1] or inner or quantified
+        elif quantifier:
+            groups[-1] = True
+            i = quantifier.end()
+            continue
+        i += 1
+
+    if len(WILDCARD.findall(pattern)) > MAX_WILDCARDS:
+        risks.append(f"more than {MAX_WILDCARDS} unbounded wildcards")
+    return risks
+
+
+def compile_pattern(pattern: str) -> dict:
+    """
+    compiles a rule pattern. plain text patterns, optionally anchored with ^ or $,
+    are matched as lowercase substrings of the column values. other patterns are
+    matched with a case insensitive regex.
+
+    the values of a column are searched as one text, separated by SEPARATOR, so
+    ^ and $ become a separator before and after the pattern text.
+
+    :param pattern: pattern from the rules.
+    :return: dictionary with the match path, the regex and the substrings to search for.
+    """
+    regex = re.compile(pattern, re.IGNORECASE)
+
+    at_start = pattern.startswith("^")
+    at_end = pattern.endswith("$")
+    text = pattern[int(at_start) : len(pattern) - int(at_end)]
+    if (
+        not text
+        or NOT_LOWER_SAFE.search(text)
+        or any(char in REGEX_METACHARACTERS for char in text)
+    ):
+        return {"kind": "regex", "regex": regex}
+
+    text = (SEPARATOR if at_start else "") + text.lower()
+    # $ matches also before a newline at the end
+    needles = [text + SEPARATOR, text + "\n" + SEPARATOR] if at_end else [text]
+    kind = "anchored" if at_start or at_end else "literal"
+    return {"kind": kind, "regex": regex, "needles": needles}
+
+
+def compile_rules(rules_df: pd.DataFrame, patterns: dict = None) -> list:
+    """
+    compiles the categorization rules once: text patterns with compile_pattern and
+    amount conditions to sign codes. patterns matching anything are left out.
+
+    :param rules_df: dataframe containing the validated categorization rules.
+    :param patterns: if given, compiled patterns by pattern, reused and filled with new patterns.
+    :return: list of compiled rules in rule order.
+    """
+    if patterns is None:
+        patterns = {}
+
+    rules = []
+    for position, rule in enumerate(rules_df.to_dict("records")):
+        try:
+            rule_patterns = {}
+            for column in TEXT_COLUMNS:
+                if rule[column] != MATCH_ALL:
+                    if rule[column] not in patterns:
+                        patterns[rule[column]] = compile_pattern(rule[column])
+                    rule_patterns[column] = patterns[rule[column]]
+        except TypeError:
+            logging.error(f"error - empty cell in categories.csv rule id: {rule['id']}")
+            raise
+
+        kinds = [pattern["kind"] for pattern in rule_patterns.values()]
+        rules.append(
+            {
+                "position": position,
+                "id": rule["id"],
+                "patterns": rule_patterns,
+                # slowest match path of the rule
+                "kind": max(kinds, key=PATTERN_KINDS.index, default="literal"),
+                "sign": SIGN_CODES.get(rule["amount"]),
+                "values": {col: rule[key] for col, key in RESULT_COLUMNS.items()},
+            }
+        )
+    return rules
+
+
+def count_match_paths(rules: list) -> dict:
+    """
+    counts the rules by their slowest match path.
+
+    :param rules: compiled rules from compile_rules.
+    :return: dictionary with the number of rules by match path.
+    """
+    counts = {kind: 0 for kind in PATTERN_KINDS}
+    for rule in rules:
+        counts[rule["kind"]] += 1
+    return counts
+
+
+def amount_signs(amounts: pd.Series) -> np.ndarray:
+    """
+    returns the sign of each amount as 1, -1 or 0. missing amounts get NaN and
+    match no amount condition.
+
+    :param amounts: series of amounts.
+    :return: array of amount signs.
+    """
+    return np.sign(amounts.astype(float).to_numpy())
+
+
+def categorization_keys(df: pd.DataFrame) -> tuple:
+    """
+    returns the distinct categorization keys of the dataframe. rules only read
+    account, description, info and the sign of amount, so rows with the same key
+    always get the same result.
+
+    :param df: dataframe with account, description, info and amount columns.
+    :return: tuple of the distinct keys dataframe and the key position of each row.
+    """
+    key_df = pd.DataFrame(
+        {column: df[column].astype(object).to_numpy() for column in TEXT_COLUMNS}
+    )
+    key_df["sign"] = amount_signs(df["amount"])
+
+    row_keys = key_df.groupby(KEY_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows = np.unique(row_keys, return_index=True)
+    keys = key_df.iloc[first_rows].reset_index(drop=True)
+    return keys, row_keys
+
+
+def evaluation_context(keys: pd.DataFrame, key_rows: np.ndarray = None) -> dict:
+    """
+    builds the evaluation context of the keys once, so rules evaluated against
+    the same keys share it: the keys grouped by account with the column indexes and
+    amount signs of each group. the lowercase searched texts are built on first use
+    and the account pattern matches are kept by pattern.
+
+    :param keys: dataframe with account, description, info and sign columns.
+    :param key_rows: number of rows behind each key, used in the rule profile. if None, 1 per key.
+    :return: dictionary with the keys, account index, account groups and account matches.
+    """
+    if key_rows is None:
+        key_rows = np.ones(len(keys), dtype=np.int64)
+
+    accounts = column_index(keys["account"])
+    codes = accounts["codes"]
+    order = np.argsort(codes, kind="stable")
+    group_codes, group_starts = np.unique(codes[order], return_index=True)
+
+    groups = []
+    for code, rows in zip(group_codes, np.split(order, group_starts[1:])):
+        group = keys.iloc[rows]
+        groups.append(
+            {
+                "code": code,
+                "rows": rows,
+                "indexes": {
+                    column: column_index(group[column])
+                    for column in ["description", "info"]
+                },
+                "signs": group["sign"].to_numpy(),
+                "weights": key_rows[rows],
+            }
+        )
+    return {
+        "keys": keys,
+        "accounts": accounts,
+        "groups": groups,
+        "account_matches": {},
+    }
+
+
+def categorization_context(df: pd.DataFrame) -> dict:
+    """
+    builds the evaluation context of the distinct keys of the dataframe, with the
+    key of each row by row label.
+
+    :param df: dataframe with account, description, info and amount columns.
+    :return: dictionary from evaluation_context with row_keys and compiled patterns added.
+    """
+    keys, row_keys = categorization_keys(df)
+    context = evaluation_context(keys, np.bincount(row_keys, minlength=len(keys)))
+    context["row_keys"] = pd.Series(row_keys, index=df.index)
+    context["patterns"] = {}
+    return context
+
+
+def context_row_keys(context: dict, df: pd.DataFrame) -> np.ndarray:
+    """
+    returns the key of each row from the context of an earlier categorization of
+    the same rows. the rows can be in another order, but their account,
+    description, info and amount must not have changed.
+
+    :param context: context from categorization_context.
+    :param df: dataframe categorized earlier with the context.
+    :return: array with the key position of each row, or None if the rows are not the same.
+    """
+    row_keys = context.get("row_keys")
+    if (
+        row_keys is None
+        or len(row_keys) != len(df)
+        or not df.index.is_unique
+        or not row_keys.index.is_unique
+    ):
+        return None
+
+    row_keys = row_keys.reindex(df.index)
+    if row_keys.isna().any():
+        return None
+    return row_keys.to_numpy(dtype=np.int64)
+
+
+def column_index(values: pd.Series) -> dict:
+    """
+    factorizes a column for pattern matching. the searched text of the values is
+    built on first use by search_text.
+
+    :param values: column to index.
+    :return: dictionary with row codes and distinct values of the column.
+    """
+    codes, uniques = pd.factorize(values)
+    return {"codes": codes, "uniques": uniques, "text": None}
+
+
+def search_text(index: dict) -> dict:
+    """
+    builds the lowercase text of the distinct string values of a column, separated
+    by SEPARATOR, and the start position of each value in it. values that are not
+    strings or that str.lower() can't fold safely are left empty in the text.
+
+    :param index: column index from column_index.
+    :return: dictionary with the text, the start positions and the values to match with regex.
+    """
+    if index["text"] is None:
+        values = [value if isinstance(value, str) else "" for value in index["uniques"]]
+        unsafe = np.array(
+            [NOT_LOWER_SAFE.search(value) is not None for value in values], dtype=bool
+        )
+        lowered = [
+            "" if unsafe_value else value.lower()
+            for value, unsafe_value in zip(values, unsafe)
+        ]
+        starts = np.cumsum([1] + [len(value) + 1 for value in lowered])[:-1]
+        index["text"] = {
+            "text": SEPARATOR + SEPARATOR.join(lowered) + SEPARATOR,
+            "starts": starts.tolist(),
+            "unsafe": np.flatnonzero(unsafe),
+        }
+    return index["text"]
+
+
+def find_substring(text: dict, needle: str) -> np.ndarray:
+    """
+    finds the distinct values containing a substring. the search jumps to the next
+    value after each hit, so each value is reported once.
+
+    :param text: searched text from search_text.
+    :param needle: lowercase substring, can start or end with SEPARATOR.
+    :return: boolean array by distinct value.
+    """
+    starts = text["starts"]
+    found = np.zeros(len(starts), dtype=bool)
+    # a needle starting with SEPARATOR is found just before its value
+    offset = int(needle.startswith(SEPARATOR))
+
+    position = text["text"].find(needle)
+    while position != -1:
+        value = bisect_right(starts, position + offset) - 1
+        found[value] = True
+        if value + 1 >= len(starts):
+            break
+        position = text["text"].find(needle, starts[value + 1] - offset)
+    return found
+
+
+def value_matches(pattern: dict, index: dict, codes: np.ndarray = None) -> np.ndarray:
+    """
+    matches a pattern against the distinct values of a column. values that are not
+    strings never match, like with str.contains(na=False).
+
+    :param pattern: compiled pattern from compile_pattern.
+    :param index: column index from column_index.
+    :param codes: if given, regexes are matched only on the values of these row codes.
+    :return: boolean array by distinct value.
+    """
+    uniques = index["uniques"]
+    if pattern["kind"] == "regex":
+        if codes is None:
+            values = range(len(uniques))
+        else:
+            values = np.unique(codes[codes >= 0])
+        matches = np.zeros(len(uniques), dtype=bool)
+        for value in values:
+            text = uniques[value]
+            matches[value] = (
+                isinstance(text, str) and pattern["regex"].search(text) is not None
+            )
+        return matches
+
+    text = search_text(index)
+    matches = np.zeros(len(uniques), dtype=bool)
+    for needle in pattern["needles"]:
+        matches |= find_substring(text, needle)
+    for value in text["unsafe"]:
+        matches[value] = pattern["regex"].search(uniques[value]) is not None
+    return matches
+
+
+def pattern_mask(pattern: dict, index: dict) -> np.ndarray:
+    """
+    matches a pattern against the distinct values of a column and maps the result
+    to rows.
+
+    :param pattern: compiled pattern from compile_pattern.
+    :param index: column index from column_index.
+    :return: boolean mask of matching rows.
+    """
+    # extra False at the end is picked by code -1
+    return np.append(value_matches(pattern, index), False)[index["codes"]]
+
+
+def account_buckets(rules: list) -> tuple:
+    """
+    splits the rules into wildcard rules, matching any account, and buckets of
+    rules sharing the same account pattern.
+
+    :param rules: compiled rules from compile_rules.
+    :return: tuple of the wildcard rules and a dictionary of rules by account pattern.
+    """
+    wildcard = []
+    buckets = {}
+    for rule in rules:
+        if "account" in rule["patterns"]:
+            pattern = rule["patterns"]["account"]["regex"].pattern
+            buckets.setdefault(pattern, []).append(rule)
+        else:
+            wildcard.append(rule)
+    return wildcard, buckets
+
+
+def rule_rows(
+    rule: dict, indexes: dict, signs: np.ndarray, rows: np.ndarray
+) -> np.ndarray:
+    """
+    finds the rows a rule matches. the amount sign is checked first and each
+    pattern is matched only on the rows still matching, so a rule stops as soon as
+    no rows are left. the account pattern is known to match and not evaluated.
+
+    :param rule: compiled rule from compile_rules.
+    :param indexes: column indexes of description and info from column_index.
+    :param signs: amount sign of each row.
+    :param rows: positions of the candidate rows.
+    :return: positions of the matching rows.
+    """
+    if rule["sign"] is not None:
+        rows = rows[signs[rows] == rule["sign"]]
+
+    for column, pattern in rule["patterns"].items():
+        if column == "account" or not len(rows):
+            continue
+        codes = indexes[column]["codes"][rows]
+        matches = value_matches(pattern, indexes[column], codes)
+        # extra False at the end is picked by code -1
+        rows = rows[np.append(matches, False)[codes]]
+
+    return rows
+
+
+class RuleTimeout(Exception):
+    """
+    raised by the rule alarm when a rule runs out of its time budget.
+    """
+
+
+def alarm_available() -> bool:
+    """
+    checks if a stalled rule can be stopped with an alarm signal. SIGALRM exists
+    on posix only and signal handlers can only be set in the main thread, which
+    is also the thread running the tasks of a worker process.
+
+    :return: True if the rule alarm can be used, False otherwise.
+    """
+    return (
+        hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+
+
+@contextmanager
+def rule_alarm(enabled: bool):
+    """
+    sets a SIGALRM handler raising RuleTimeout while rules are evaluated. the
+    regex engine checks for signals while searching, so the alarm stops even a
+    backtracking pattern. evaluate_bucket arms the timer for each rule.
+
+    :param enabled: if False, nothing is set.
+    """
+    if not enabled:
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise RuleTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def evaluate_bucket(
+    group: dict,
+    rules: list,
+    profile: dict,
+    reverse: bool = True,
+    candidates: np.ndarray = None,
+    time_budget: float = None,
+) -> np.ndarray:
+    """
+    evaluates rules against the keys of one account.
+
+    by default rules are evaluated from last to first. the first matching rule
+    found wins the key, same as the last matching rule in rule order, and later
+    evaluated rules only look at keys not won yet. evaluation stops when all keys
+    are won. with reverse=False every rule is evaluated on all keys in rule order,
+    which is needed to count all rows each rule matches.
+
+    :param group: account group from evaluation_context.
+    :param rules: compiled rules matching the account, in rule order.
+    :param profile: evaluation time and matched rows are added to it by rule position.
+    :param reverse: if True, evaluate rules from last to first on keys not won yet.
+    :param candidates: positions in the group of the keys to evaluate. if None, all keys.
+    :param time_budget: if given, seconds a rule may take in total before it's stopped,
+        needs the handler of rule_alarm.
+    :return: array with the position of the winning rule for each key in the group, -1 if none matched.
+    """
+    indexes = group["indexes"]
+    signs = group["signs"]
+    weights = group["weights"]
+    winners = np.full(len(group["rows"]), -1, dtype=np.int64)
+    if candidates is None:
+        candidates = np.arange(len(group["rows"]))
+
+    for rule in reversed(rules) if reverse else rules:
+        if not len(candidates):
+            break
+
+        stats = profile.setdefault(rule["position"], {"seconds": 0, "matched": 0})
+        start_time = time.perf_counter()
+        try:
+            if time_budget is not None:
+                remaining = max(time_budget - stats["seconds"], 0.001)
+                signal.setitimer(signal.ITIMER_REAL, remaining)
+            matched = rule_rows(rule, indexes, signs, candidates)
+            if time_budget is not None:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except RuleTimeout:
+            message = (
+                f"rule id: {rule['id']} stopped after the {time_budget}s time budget, "
+                "check its patterns in categories.csv or raise RULE_TIME_BUDGET"
+            )
+            logging.error(f"categorize: {message}")
+            raise TimeoutError(message) from None
+        except KeyboardInterrupt:
+            # a stalled regex is stopped with ctrl + c, tell which rule it was
+            logging.error(
+                f"categorization stopped while evaluating rule id: {rule['id']}"
+            )
+            raise
+        winners[matched] = rule["position"]
+        if reverse:
+            candidates = candidates[winners[candidates] < 0]
+
+        stats["seconds"] += time.perf_counter() - start_time
+        stats["matched"] += int(weights[matched].sum())
+
+    return winners
+
+
+def evaluate_rules(
+    df: pd.DataFrame,
+    rules: list,
+    profile: dict = None,
+    time_budget: float = None,
+    reverse: bool = True,
+    context: dict = None,
+    rows: np.ndarray = None,
+) -> np.ndarray:
+    """
+    evaluates all rules against the dataframe. rows are grouped by account and
+    each group is evaluated only against the wildcard rules and the account
+    buckets whose pattern matches the account, with evaluate_bucket. the last
+    matching rule wins like in the rule by rule categorization. patterns are
+    matched only on the distinct values of each column.
+
+    :param df: dataframe with account, description, info and sign columns.
+    :param rules: compiled rules from compile_rules.
+    :param profile: if given, evaluation time and matched rows are added to it by rule position.
+    :param time_budget: seconds a rule may take. a rule over it is stopped with a
+        TimeoutError, or only reported after the evaluation where SIGALRM is not
+        available (windows, threads). if None, use settings.
+    :param reverse: if True, evaluate rules from last to first on rows not won yet.
+    :param context: evaluation context of df from evaluation_context. if None, it's built here.
+    :param rows: positions of the rows to evaluate. if None, all rows.
+    :return: array with the position of the winning rule for each evaluated row, -1 if none matched.
+    """
+    winners = np.full(len(df), -1, dtype=np.int64)
+    if df.empty or not rules or (rows is not None and not len(rows)):
+        return winners if rows is None else winners[rows]
+    if profile is None:
+        profile = {}
+    if time_budget is None:
+        time_budget = SETTINGS["rule_time_budget"]
+    if context is None:
+        context = evaluation_context(df)
+    selected = None
+    if rows is not None:
+        selected = np.zeros(len(df), dtype=bool)
+        selected[rows] = True
+
+    wildcard, buckets = account_buckets(rules)
+    account_matches = context["account_matches"]
+    for pattern, bucket in buckets.items():
+        if pattern not in account_matches:
+            account_matches[pattern] = value_matches(
+                bucket[0]["patterns"]["account"], context["accounts"]
+            )
+
+    alarm = time_budget > 0 and alarm_available()
+    with rule_alarm(alarm):
+        for group in context["groups"]:
+            code = group["code"]
+            candidates = None
+            if selected is not None:
+                candidates = np.flatnonzero(selected[group["rows"]])
+                if not len(candidates):
+                    continue
+            # missing accounts match only wildcard rules
+            bucket_rules = wildcard + [
+                rule
+                for pattern, bucket in buckets.items()
+                if code >= 0 and account_matches[pattern][code]
+                for rule in bucket
+            ]
+            if bucket_rules:
+                bucket_rules.sort(key=lambda rule: rule["position"])
+                winners[group["rows"]] = evaluate_bucket(
+                    group,
+                    bucket_rules,
+                    profile,
+                    reverse,
+                    candidates,
+                    time_budget if alarm else None,
+                )
+
+    if alarm:
+        return winners if rows is None else winners[rows]
+
+    # without the alarm, rules over the budget can only be reported afterwards
+    over_budget = [
+        f"{rule['id']} ({profile[rule['position']]['seconds']:.1f}s)"
+        for rule in rules
+        if profile.get(rule["position"], {}).get("seconds", 0) > time_budget
+    ]
+    if over_budget:
+        logging.warning(
+            f"categorize: rules over the {time_budget}s time budget, check their "
+            f"patterns in categories.csv, rule ids: {', '.join(over_budget)}"
+        )
+    return winners if rows is None else winners[rows]
+
+
+def rule_profile(
+    rules: list, profile: dict, winners: np.ndarray, key_rows: np.ndarray
+) -> pd.DataFrame:
+    """
+    builds the rule profile report. dead rules match no rows, shadowed rules
+    match rows but a later rule wins all of them.
+
+    :param rules: compiled rules from compile_rules.
+    :param profile: evaluation time and matched rows by rule position from evaluate_rules.
+    :param winners: winning rule position of each key.
+    :param key_rows: number of rows behind each key.
+    :return: dataframe with one row per rule, slowest rules first.
+    """
+    matched = winners >= 0
+    won = np.bincount(
+        winners[matched], weights=key_rows[matched], minlength=len(rules)
+    ).astype(np.int64)
+
+    report = pd.DataFrame(
+        {
+            "rule_id": [rule["id"] for rule in rules],
+            "position": [rule["position"] for rule in rules],
+            "match_path": [rule["kind"] for rule in rules],
+            "time_ms": [
+                profile.get(rule["position"], {}).get("seconds", 0) * 1000
+                for rule in rules
+            ],
+            "rows_matched": [
+                profile.get(rule["position"], {}).get("matched", 0) for rule in rules
+            ],
+            "rows_won": won[: len(rules)],
+        }
+    )
+    report["status"] = np.select(
+        [report["rows_matched"] == 0, report["rows_won"] == 0],
+        ["dead", "shadowed"],
+        default="ok",
+    )
+    report["time_ms"] = report["time_ms"].round(3)
+    return report.sort_values(
+        ["time_ms", "position"], ascending=[False, True]
+    ).reset_index(drop=True)
+
+
+def init_worker(rules: list):
+    """
+    stores the compiled rules in a worker process when it starts, so they are
+    sent to each worker once instead of with every shard.
+
+    :param rules: compiled rules from compile_rules.
+    """
+    global _worker_rules
+    _worker_rules = rules
+
+
+def evaluate_shard(df: pd.DataFrame) -> np.ndarray:
+    """
+    evaluates the rules of the worker process against a shard of rows.
+
+    :param df: shard of the dataframe passed to evaluate_rules_parallel.
+    :return: array with the position of the winning rule for each row.
+    """
+    return evaluate_rules(df, _worker_rules)
+
+
+def evaluate_rules_parallel(
+    df: pd.DataFrame,
+    rules: list,
+    workers: int,
+    context: dict = None,
+    rows: np.ndarray = None,
+) -> np.ndarray:
+    """
+    evaluates the rules with evaluate_rules in a process pool. the rows are split
+    into one shard per worker and the results are joined back in row order.
+    inputs too small for more than one shard of MIN_SHARD_ROWS are evaluated
+    serially with the evaluation context.
+
+    :param df: dataframe with account, description, info and sign columns.
+    :param rules: compiled rules from compile_rules.
+    :param workers: number of worker processes.
+    :param context: evaluation context of df from evaluation_context, used when evaluated serially.
+    :param rows: positions of the rows to evaluate. if None, all rows.
+    :return: array with the position of the winning rule for each evaluated row, -1 if none matched.
+    """
+    row_count = len(df) if rows is None else len(rows)
+    shard_count = min(workers, row_count // MIN_SHARD_ROWS)
+    if shard_count <= 1:
+        return evaluate_rules(df, rules, context=context, rows=rows)
+
+    if rows is not None:
+        df = df.iloc[rows].reset_index(drop=True)
+
+    logging.info(f"categorize in parallel: {shard_count} shards, {workers} workers")
+    shards = np.array_split(np.arange(len(df)), shard_count)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(rules,)
+    ) as executor:
+        results = executor.map(evaluate_shard, [df.iloc[shard] for shard in shards])
+        return np.concatenate(list(results))
+
+
+def assign_results(df: pd.DataFrame, rules: list, winners: np.ndarray) -> pd.DataFrame:
+    """
+    writes rule_id, class, category and sub_category of the winning rules to the
+    dataframe. rows without a winning rule keep their current values.
+
+    :param df: dataframe to categorize.
+    :param rules: compiled rules from compile_rules.
+    :param winners: winning rule positions from evaluate_rules.
+    :return: categorized dataframe.
+    """
+    matched = winners >= 0
+    for column in RESULT_COLUMNS:
+        values = np.array([rule["values"][column] for rule in rules], dtype=object)
+        df.loc[matched, column] = values[winners[matched]]
+    return df
+
+
+def rules_fingerprint(rules_df: pd.DataFrame) -> str:
+    """
+    returns a fingerprint of the validated rules. any edit to categories.csv
+    changes the fingerprint.
+
+    :param rules_df: dataframe containing the validated categorization rules.
+    :return: hex digest of the rules.
+    """
+    content = f"{MEMO_VERSION}\n" + rules_df.to_csv(index=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def load_memo(memo_folder: str, fingerprint: str) -> pd.DataFrame:
+    """
+    loads the categorization memo saved for the rules fingerprint.
+
+    :param memo_folder: folder containing the categorization memo.
+    :param fingerprint: fingerprint of the rules from rules_fingerprint.
+    :return: dataframe with key columns and the winning rule position, or None if not saved.
+    """
+    memo = load_frame(memo_folder, f"memo_{fingerprint}")
+    if memo is None:
+        return None
+
+    memo[TEXT_COLUMNS] = memo[TEXT_COLUMNS].astype(object)
+    return memo.drop_duplicates(subset=KEY_COLUMNS)
+
+
+def memo_files(memo_folder: str) -> list:
+    """
+    lists the memo and rules files saved by save_memo in the memo folder, other
+    files in the folder are not listed.
+
+    :param memo_folder: folder containing the categorization memo.
+    :return: list of file paths.
+    """
+    if not os.path.isdir(memo_folder):
+        return []
+    return [
+        os.path.join(memo_folder, file_name)
+        for file_name in sorted(os.listdir(memo_folder))
+        if MEMO_FILE.fullmatch(file_name)
+    ]
+
+
+def save_memo(
+    memo: pd.DataFrame, memo_folder: str, fingerprint: str, rules_df: pd.DataFrame
+):
+    """
+    saves the categorization memo with its rules and removes memos of older rules.
+    only memo and rules files are removed, other files in the folder are kept.
+
+    :param memo: dataframe with key columns and the winning rule position.
+    :param memo_folder: folder containing the categorization memo.
+    :param fingerprint: fingerprint of the rules from rules_fingerprint.
+    :param rules_df: dataframe containing the validated rules of the memo.
+    """
+    save_frame(memo, memo_folder, f"memo_{fingerprint}")
+    save_frame(rules_df, memo_folder, f"rules_{fingerprint}")
+
+    current = [
+        os.path.abspath(frame_cache_path(memo_folder, f"{name}_{fingerprint}"))
+        for name in ["memo", "rules"]
+    ]
+    for memo_path in memo_files(memo_folder):
+        if os.path.abspath(memo_path) not in current:
+            try:
+                os.remove(memo_path)
+            except OSError as e:
+                logging.warning(f"cache not removed {os.path.basename(memo_path)}: {e}")
+
+
+def load_previous_memo(memo_folder: str) -> dict:
+    """
+    loads the saved categorization memo with its rules, whatever the rules are.
+
+    :param memo_folder: folder containing the categorization memo.
+    :return: dictionary with fingerprint, rules and memo, or None if not saved.
+    """
+    rule_files = [
+        MEMO_FILE.fullmatch(os.path.basename(file_path))
+        for file_path in memo_files(memo_folder)
+    ]
+    rule_files = [match for match in rule_files if match.group(1) == "rules"]
+    if len(rule_files) != 1:
+        return None
+
+    fingerprint = rule_files[0].group(2)
+    rules_df = load_frame(memo_folder, f"rules_{fingerprint}")
+    memo = load_memo(memo_folder, fingerprint)
+    if rules_df is None or memo is None:
+        return None
+    return {"fingerprint": fingerprint, "rules": rules_df, "memo": memo}
+
+
+def rule_signatures(rules_df: pd.DataFrame) -> list:
+    """
+    returns each rule as a tuple of its values, missing values as None.
+
+    :param rules_df: dataframe containing the validated categorization rules.
+    :return: list of rule signatures in rule order.
+    """
+    rules_df = rules_df.astype(object)
+    return list(rules_df.where(rules_df.notna(), None).itertuples(index=False))
+
+
+def rules_diff(old_rules_df: pd.DataFrame, new_rules_df: pd.DataFrame) -> dict:
+    """
+    compares two rule sets. the diff can be used only when the rules in both
+    sets keep their relative order, else a rule could start to win over another.
+
+    :param old_rules_df: dataframe containing the previous validated rules.
+    :param new_rules_df: dataframe containing the new validated rules.
+    :return: dictionary with the new position of each old rule (-1 if removed) and the positions of added rules, or None if the rules can't be compared.
+    """
+    if list(old_rules_df.columns) != list(new_rules_df.columns):
+        return None
+
+    old_signatures = rule_signatures(old_rules_df)
+    new_signatures = rule_signatures(new_rules_df)
+    new_positions = {signature: i for i, signature in enumerate(new_signatures)}
+    if len(new_positions) != len(new_signatures) or len(set(old_signatures)) != len(
+        old_signatures
+    ):
+        # identical rules can't be told apart
+        return None
+
+    positions = np.array(
+        [new_positions.get(signature, -1) for signature in old_signatures],
+        dtype=np.int64,
+    )
+    kept = positions[positions >= 0]
+    if (np.diff(kept) < 0).any():
+        return None
+
+    old_set = set(old_signatures)
+    added = [
+        i for i, signature in enumerate(new_signatures) if signature not in old_set
+    ]
+    return {"positions": positions, "added": added}
+
+
+def update_winners(
+    keys: pd.DataFrame,
+    winners: np.ndarray,
+    diff: dict,
+    rules: list,
+    context: dict = None,
+) -> np.ndarray:
+    """
+    updates the winning rules of the keys after a rule change. keys keep their
+    winning rule unless an added rule later in the order matches them. keys whose
+    winning rule was removed are evaluated again against all rules. keys without a
+    winning rule can only be matched by an added rule.
+
+    :param keys: keys evaluated with the previous rules.
+    :param winners: winning rule positions of the keys with the previous rules.
+    :param diff: rule changes from rules_diff.
+    :param rules: compiled new rules from compile_rules.
+    :param context: evaluation context of the keys from evaluation_context. if None, it's built here.
+    :return: array of winning rule positions with the new rules.
+    """
+    if context is None:
+        context = evaluation_context(keys)
+    new_winners = np.where(winners >= 0, diff["positions"][winners], -1)
+
+    if diff["added"]:
+        added_rules = [rules[position] for position in diff["added"]]
+        new_winners = np.maximum(
+            new_winners, evaluate_rules(keys, added_rules, context=context)
+        )
+
+    removed = (winners >= 0) & (diff["positions"][winners] < 0)
+    if removed.any():
+        new_winners[removed] = evaluate_rules(
+            keys, rules, context=context, rows=np.flatnonzero(removed)
+        )
+
+    logging.info(
+        f"categorize: {len(diff['added'])} rules added, "
+        f"{(diff['positions'] < 0).sum()} removed, {removed.sum()} keys evaluated again"
+    )
+    return new_winners
+
+
+def find_memo(
+    memo_folder: str, rules_df: pd.DataFrame, rules: list, use_saved: bool = True
+) -> pd.DataFrame:
+    """
+    finds the categorization memo for the rules. a memo of earlier rules, from
+    memory or from the memo folder, is updated with the rule changes instead of
+    starting over.
+
+    :param memo_folder: folder containing the categorization memo.
+    :param rules_df: dataframe containing the validated categorization rules.
+    :param rules: compiled rules from compile_rules.
+    :param use_saved: if True, use the memo saved in the memo folder.
+    :return: tuple of the memo, or None if no memo, True if the memo was updated and the evaluation context of the memo keys, or None if not built.
+    """
+    fingerprint = rules_fingerprint(rules_df)
+    if use_saved:
+        memo = load_memo(memo_folder, fingerprint)
+        if memo is not None:
+            return memo, False, None
+
+    previous = _memos.get(memo_folder)
+    if previous is None and use_saved:
+        previous = load_previous_memo(memo_folder)
+    if previous is None:
+        return None, False, None
+    if previous["fingerprint"] == fingerprint:
+        return previous["memo"], False, previous.get("context")
+
+    diff = rules_diff(previous["rules"], rules_df)
+    if diff is None:
+        logging.info("categorize: rule order changed, all keys evaluated again")
+        return None, False, None
+
+    memo = previous["memo"].copy()
+    keys = memo[KEY_COLUMNS].reset_index(drop=True)
+    # the context of the memo keys is kept while no keys are added to the memo
+    context = previous.get("context")
+    if context is None:
+        context = evaluation_context(keys)
+    memo["winner"] = update_winners(
+        keys, memo["winner"].to_numpy(dtype=np.int64), diff, rules, context
+    )
+    return memo, True, context
+
+
+def store_memo(
+    memo: pd.DataFrame,
+    memo_folder: str,
+    rules_df: pd.DataFrame,
+    save: bool = True,
+    context: dict = None,
+):
+    """
+    keeps the categorization memo in memory for the next categorization, and
+    saves it to the memo folder.
+
+    :param memo: dataframe with key columns and the winning rule position.
+    :param memo_folder: folder containing the categorization memo.
+    :param rules_df: dataframe containing the validated rules of the memo.
+    :param save: if True, save the memo to the memo folder.
+    :param context: evaluation context of the memo keys from find_memo, kept with the memo.
+    """
+    fingerprint = rules_fingerprint(rules_df)
+    _memos[memo_folder] = {
+        "fingerprint": fingerprint,
+        "rules": rules_df.copy(),
+        "memo": memo,
+        "context": context,
+    }
+    if save:
+        save_memo(memo, memo_folder, fingerprint, rules_df)
+
+
+def lookup_memo(keys: pd.DataFrame, memo: pd.DataFrame) -> np.ndarray:
+    """
+    looks up the winning rule positions of the keys from the memo.
+
+    :param keys: distinct keys from categorization_keys.
+    :param memo: dataframe with key columns and the winning rule position.
+    :return: array of winning rule positions, -1 if none matched and -2 if not in the memo.
+    """
+    if memo is None or memo.empty:
+        return np.full(len(keys), -2, dtype=np.int64)
+
+    merged = keys.merge(memo, on=KEY_COLUMNS, how="left")
+    return merged["winner"].fillna(-2).to_numpy(dtype=np.int64)
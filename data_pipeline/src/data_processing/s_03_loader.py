@@ -6,104 +6,147 @@ import os
 from pprint import pformat
 
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import save_on_debug, parse_date
+from data_pipeline.src.utils.helpers import save_on_debug, parse_dates, parse_amounts
+from data_pipeline.src.utils.cache import (
+    frame_warnings_path,
+    save_frame,
+    save_json_cache,
+)
+from data_pipeline.src.utils.schema import apply_schema
+
+
+def normalize_dataframe(file_path: str, data: dict) -> tuple:
+    """
+    renames, selects and converts the columns of a read source file.
+
+    :param file_path: path to the source file.
+    :param data: dictionary containing the dataframe and its properties.
+    :return: tuple of the normalized dataframe and the logged warnings.
+    """
+    props = data["props"]
+    warnings = []
+
+    try:
+        df = data["dataframe"]
+        column_mapping = props["columns"]
+
+        # reverse so that key is old col and value is new col
+        reverse_column_mapping = {v: k for k, v in column_mapping.items()}
+
+        # rename columns
+        df.rename(columns=reverse_column_mapping, inplace=True)
+
+        # log column mappings
+        logging.debug(f"{os.path.basename(file_path)} column mapping:")
+        for old_col, new_col in column_mapping.items():
+            logging.debug(f"{old_col} -> {new_col}")
+
+        # add columns if not present
+        if "account" not in df.columns:
+            df["account"] = props["account"]
+        if "row_type" not in df.columns:
+            df["row_type"] = "Actual"
+
+        # check if required columns are present
+        required_columns = [
+            "date",
+            "account",
+            "description",
+            "info",
+            "amount",
+            "row_type",
+        ]
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        if missing_columns:
+            raise KeyError(f"missing required columns: {missing_columns}")
+
+        # select columns
+        df = df.loc[
+            :,
+            required_columns,
+        ]
+
+        # add source file
+        df.loc[:, "source_file"] = props["file_name"]
+
+        save_on_debug(
+            df,
+            os.path.join(SETTINGS["debug_folder"], "3_append_1_before_types.csv"),
+        )
+
+        # convert types
+        df["amount"] = parse_amounts(
+            df["amount"],
+            decimal_separator=props.get("decimal_separator"),
+            thousands_separator=props.get("thousands_separator"),
+            minus_signs=props.get("minus_signs"),
+        )
+        df["date"], unparsed_dates = parse_dates(
+            df["date"], formats=props["date_format"], dayfirst=props["day_first"]
+        )
+        if not unparsed_dates.empty:
+            warnings.append(
+                f"dates not parsed: {len(unparsed_dates)} rows in {props['file_name']}"
+                + f" with formats {props['date_format']}, i.e. "
+                + ", ".join(unparsed_dates.astype(str).unique()[:5])
+            )
+            logging.warning(warnings[-1])
+        df["info"] = df["info"].fillna("")
+
+        save_on_debug(
+            df, os.path.join(SETTINGS["debug_folder"], "3_append_2_after_types.csv")
+        )
+
+        return df, warnings
+
+    except KeyError as e:
+        logging.error(
+            f"key error in append: {os.path.basename(file_path)}"
+            + f"\nproperties:\n{pformat(props)}"
+            + f"\nerror: {e}"
+        )
+        raise
+    except Exception as e:
+        logging.error(f"error - append_dataframes file {file_path}: {e}")
+        raise
 
 
 def append_dataframes(dataframes: dict) -> pd.DataFrame:
     """
     appends multiple dataframes into a single dataframe.
 
+    dataframes loaded from the parse cache are already normalized and used as is,
+    the warnings of their normalization are logged again. other dataframes are
+    normalized and stored to the parse cache with their warnings if they have a cache_key.
+
     :param dataframes: dictionary containing dataframes and their properties.
     :return: the combined dataframe.
     """
     df_list = []
 
     for file_path, data in dataframes.items():
-        try:
-
-            df = data["dataframe"]
-            props = data["props"]
-            column_mapping = props["columns"]
-
-            # reverse so that key is old col and value is new col
-            reverse_column_mapping = {v: k for k, v in column_mapping.items()}
-
-            # rename columns
-            df.rename(columns=reverse_column_mapping, inplace=True)
-
-            # log column mappings
-            logging.debug(f"{os.path.basename(file_path)} column mapping:")
-            for old_col, new_col in column_mapping.items():
-                logging.debug(f"{old_col} -> {new_col}")
-
-            # add columns if not present
-            if "account" not in df.columns:
-                df["account"] = props["account"]
-            if "row_type" not in df.columns:
-                df["row_type"] = "Actual"
-
-            # check if required columns are present
-            required_columns = [
-                "date",
-                "account",
-                "description",
-                "info",
-                "amount",
-                "row_type",
-            ]
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                raise KeyError(f"missing required columns: {missing_columns}")
-
-            # select columns
-            df = df.loc[
-                :,
-                required_columns,
-            ]
-
-            # add source file
-            df.loc[:, "source_file"] = props["file_name"]
-
-            save_on_debug(
-                df,
-                os.path.join(SETTINGS["debug_folder"], "3_append_1_before_types.csv"),
-            )
-
-            # convert types
-            df["amount"] = (
-                df["amount"]
-                .astype(str)
-                .str.replace("\xa0", "")
-                .str.replace(",", ".")
-                .str.replace("−", "-")
-                .astype(float)
-            )
-            df["date"] = df["date"].apply(
-                lambda x: parse_date(
-                    x, formats=props["date_format"], dayfirst=props["day_first"]
+        if data.get("normalized"):
+            for warning in data.get("warnings", []):
+                logging.warning(warning)
+            df_list.append(data["dataframe"])
+            continue
+
+        df, warnings = normalize_dataframe(file_path, data)
+
+        cache_key = data["props"].get("cache_key")
+        if cache_key:
+            save_frame(df, SETTINGS["parse_cache_folder"], cache_key)
+            if warnings:
+                save_json_cache(
+                    frame_warnings_path(SETTINGS["parse_cache_folder"], cache_key),
+                    {"warnings": warnings},
                 )
-            )
-            df["info"] = df["info"].fillna("")
 
-            save_on_debug(
-                df, os.path.join(SETTINGS["debug_folder"], "3_append_2_after_types.csv")
-            )
-
-            df_list.append(df)
-
-        except KeyError as e:
-            logging.error(
-                f"key error in append: {os.path.basename(file_path)}"
-                + f"\nproperties:\n{pformat(props)}"
-                + f"\nerror: {e}"
-            )
-            raise
-        except Exception as e:
-            logging.error(f"error - append_dataframes file {file_path}: {e}")
-            raise
+        df_list.append(df)
 
     df_all = pd.concat(df_list, ignore_index=True)
     df_all = df_all.dropna(subset=["date", "description"], how="all")
+    df_all = apply_schema(df_all)
 
     logging.info(f"appended: {len(df_list)} files")
 
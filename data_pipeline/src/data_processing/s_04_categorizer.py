@@ -1,11 +1,29 @@
+import numpy as np
 import pandas as pd
 import logging
 import os
 import datetime
+import time
 from tqdm import tqdm
 
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import save_on_debug
+from data_pipeline.src.data_processing.rule_engine import (
+    TEXT_COLUMNS,
+    assign_results,
+    categorization_context,
+    compile_rules,
+    context_row_keys,
+    count_match_paths,
+    evaluate_rules,
+    evaluate_rules_parallel,
+    find_memo,
+    lookup_memo,
+    regex_risks,
+    rule_profile,
+    store_memo,
+)
+from data_pipeline.src.utils.helpers import save_on_debug, write_to_csv
+from data_pipeline.src.utils.schema import apply_schema, is_categorical
 
 
 def load_categorization_rules(file_path: str) -> pd.DataFrame:
@@ -38,89 +56,264 @@ def validate_categories(df: pd.DataFrame) -> pd.DataFrame:
 
     cols_to_replace = df.columns.difference(["id", "class", "category", "sub_category"])
     # replace empty and * for source cols with .* (.* = regex, match any char)
-    df[cols_to_replace] = df[cols_to_replace].applymap(
-        lambda x: ".*" if pd.isnull(x) or x in ["", "*"] else x
+    values = df[cols_to_replace]
+    df[cols_to_replace] = values.mask(values.isna() | values.isin(["", "*"]), ".*")
+
+    # flag patterns that can stall the categorization on long texts
+    for column in TEXT_COLUMNS:
+        if column not in df.columns:
+            continue
+        risks_by_pattern = {
+            pattern: regex_risks(pattern) for pattern in df[column].unique()
+        }
+        for rule_id, pattern in zip(df["id"], df[column]):
+            risks = risks_by_pattern[pattern]
+            if risks:
+                logging.warning(
+                    f"risky pattern in {SETTINGS['categories_file']} rule id: {rule_id}, "
+                    f"{column} '{pattern}': {', '.join(risks)}"
+                )
+
+    return df
+
+
+def apply_rules_loop(
+    df: pd.DataFrame, rules_df: pd.DataFrame, context: dict = None
+) -> pd.DataFrame:
+    """
+    applies categorization rules to the dataframe one rule at a time.
+
+    :param df: dataframe to categorize.
+    :param rules_df: dataframe containing the categorization rules.
+    :param context: not used, the rules are evaluated on the rows.
+    :return: categorized dataframe.
+    """
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    message = f"{current_time} - root - INFO - categorize "
+    amounts = df["amount"].astype(float)
+    for _, rule in tqdm(
+        rules_df.iterrows(),
+        total=rules_df.shape[0],
+        desc=message,
+        bar_format="{l_bar}{bar:10}{r_bar}{bar:-10b}",
+    ):
+        try:
+            # create a mask for the current rule
+            account_mask = (
+                df["account"].str.contains(
+                    rule["account"], case=False, na=False, regex=True
+                )
+                if rule["account"] != ".*"
+                else True
+            )
+            description_mask = (
+                df["description"].str.contains(
+                    rule["description"], case=False, na=False, regex=True
+                )
+                if rule["description"] != ".*"
+                else True
+            )
+            info_mask = (
+                df["info"].str.contains(rule["info"], case=False, na=False, regex=True)
+                if rule["info"] != ".*"
+                else True
+            )
+            amount_mask = (
+                amounts > 0
+                if rule["amount"] == "pos"
+                else (
+                    amounts < 0
+                    if rule["amount"] == "neg"
+                    else (amounts == 0 if rule["amount"] == "zero" else True)
+                )
+            )
+        except TypeError as e:
+            logging.error(
+                f"TypeError - apply_categorization {SETTINGS['fixes_file']}: {e}"
+            )
+            logging.error(
+                f"error - empty cell in {SETTINGS['categories_file']} rule id: {rule['id']}"
+            )
+            raise
+
+        total_mask = account_mask & description_mask & info_mask & amount_mask
+
+        # categorize
+        df.loc[total_mask, "rule_id"] = rule["id"]
+        df.loc[total_mask, "class"] = rule["class"]
+        df.loc[total_mask, "category"] = rule["category"]
+        df.loc[total_mask, "sub_category"] = rule["sub_category"]
+
+    return df
+
+
+def evaluation_keys(df: pd.DataFrame, context: dict) -> np.ndarray:
+    """
+    fills the evaluation context of the rows on first use. the context is reused
+    while the same rows are categorized again.
+
+    :param df: dataframe to categorize.
+    :param context: evaluation context from an earlier categorization of the rows, or an empty dictionary.
+    :return: array with the key position of each row.
+    """
+    row_keys = context_row_keys(context, df)
+    if row_keys is None:
+        context.clear()
+        context.update(categorization_context(df))
+        row_keys = context["row_keys"].to_numpy()
+    return row_keys
+
+
+def apply_rules_compiled(
+    df: pd.DataFrame, rules_df: pd.DataFrame, context: dict = None
+) -> pd.DataFrame:
+    """
+    applies categorization rules to the dataframe with the compiled rule engine.
+    results of earlier runs are read from the categorization memo, so only new keys
+    and keys affected by rule changes are evaluated.
+
+    :param df: dataframe to categorize.
+    :param rules_df: dataframe containing the categorization rules.
+    :param context: evaluation context of the rows, reused between runs. if None, built for this run.
+    :return: categorized dataframe.
+    """
+    start_time = time.perf_counter()
+    if context is None:
+        context = {}
+    # rules are evaluated once per distinct key and the results joined back to the rows
+    row_keys = evaluation_keys(df, context)
+    keys = context["keys"]
+
+    rules = compile_rules(rules_df, context["patterns"])
+    match_paths = count_match_paths(rules)
+    logging.info(
+        "categorize: rules by match path: "
+        + ", ".join(f"{kind} {count}" for kind, count in match_paths.items())
     )
 
+    # results of earlier runs, updated with the rule changes since then
+    use_memo = SETTINGS["use_categorization_memo"]
+    memo_folder = SETTINGS["categorization_memo_folder"]
+    memo, memo_updated, memo_context = find_memo(
+        memo_folder, rules_df, rules, use_saved=use_memo
+    )
+
+    key_winners = lookup_memo(keys, memo)
+    new_keys = key_winners == -2
+    if new_keys.any():
+        key_winners[new_keys] = evaluate_rules_parallel(
+            keys,
+            rules,
+            SETTINGS["categorize_workers"],
+            context=context,
+            rows=np.flatnonzero(new_keys),
+        )
+        new_memo = keys[new_keys].assign(winner=key_winners[new_keys])
+        memo = new_memo if memo is None else pd.concat([memo, new_memo])
+        memo_updated = True
+        # the memo keys changed
+        memo_context = None
+
+    if memo_updated:
+        store_memo(
+            memo.reset_index(drop=True),
+            memo_folder,
+            rules_df,
+            save=use_memo,
+            context=memo_context,
+        )
+
+    df = assign_results(df, rules, key_winners[row_keys])
+
+    dedup_ratio = len(keys) / len(df) if len(df) else 0
+    logging.info(
+        f"categorize: {len(rules)} rules, {len(df)} rows, {len(keys)} distinct keys "
+        f"({dedup_ratio:.1%}), {new_keys.sum()} evaluated in "
+        f"{time.perf_counter() - start_time:.2f}s"
+    )
     return df
 
 
-def apply_categorization(df: pd.DataFrame, rules_df: pd.DataFrame) -> pd.DataFrame:
+def apply_rules_profiled(
+    df: pd.DataFrame, rules_df: pd.DataFrame, context: dict = None
+) -> pd.DataFrame:
     """
-    applies categorization rules to the dataframe.
+    applies categorization rules to the dataframe with the compiled rule engine
+    and measures each rule. all keys are evaluated without the categorization memo.
+    the rule profile report is written to the rule_profile_file.
 
     :param df: dataframe to categorize.
     :param rules_df: dataframe containing the categorization rules.
+    :param context: evaluation context of the rows, reused between runs. if None, built for this run.
+    :return: categorized dataframe.
+    """
+    if context is None:
+        context = {}
+    row_keys = evaluation_keys(df, context)
+    keys = context["keys"]
+    key_rows = np.bincount(row_keys, minlength=len(keys))
+    rules = compile_rules(rules_df, context["patterns"])
+
+    profile = {}
+    # rules are evaluated in rule order on all keys to count every match
+    key_winners = evaluate_rules(
+        keys, rules, profile=profile, reverse=False, context=context
+    )
+    df = assign_results(df, rules, key_winners[row_keys])
+
+    report = rule_profile(rules, profile, key_winners, key_rows)
+    write_to_csv(report, SETTINGS["rule_profile_file"])
+    slowest = report.iloc[0] if not report.empty else None
+    logging.info(
+        f"rule profile: {(report['status'] == 'dead').sum()} dead, "
+        f"{(report['status'] == 'shadowed').sum()} shadowed rules"
+        + (
+            f", slowest rule id {slowest['rule_id']} {slowest['time_ms']:.1f} ms"
+            if slowest is not None
+            else ""
+        )
+    )
+    return df
+
+
+CATEGORIZATION_ENGINES = {
+    "compiled": apply_rules_compiled,
+    "loop": apply_rules_loop,
+    "profile": apply_rules_profiled,
+}
+
+
+def apply_categorization(
+    df: pd.DataFrame, rules_df: pd.DataFrame, engine: str = None, context: dict = None
+) -> pd.DataFrame:
+    """
+    applies categorization rules to the dataframe. the last matching rule wins.
+
+    :param df: dataframe to categorize.
+    :param rules_df: dataframe containing the categorization rules.
+    :param engine: compiled, loop or profile. if None, use the categorization_engine setting.
+    :param context: evaluation context of the rows, reused between runs. if None, built for this run.
     :return: categorized dataframe.
     """
     try:
+        engine = engine or SETTINGS["categorization_engine"]
+        if engine not in CATEGORIZATION_ENGINES:
+            raise ValueError(
+                f"unknown categorization engine {engine}, use one of: "
+                + ", ".join(CATEGORIZATION_ENGINES)
+            )
+
         # add new columns for categorization if they don't exist
         for column in ["rule_id", "class", "category", "sub_category"]:
             if column not in df.columns:
                 df[column] = pd.NA
+            elif is_categorical(df[column]):
+                # categorized before, rules can assign new values
+                df[column] = df[column].astype(object)
 
-        # apply categorization rules
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        message = f"{current_time} - root - INFO - categorize "
-        for _, rule in tqdm(
-            rules_df.iterrows(),
-            total=rules_df.shape[0],
-            desc=message,
-            bar_format="{l_bar}{bar:10}{r_bar}{bar:-10b}",
-        ):
-            try:
-                # create a mask for the current rule
-                account_mask = (
-                    df["account"].str.contains(
-                        rule["account"], case=False, na=False, regex=True
-                    )
-                    if rule["account"] != ".*"
-                    else True
-                )
-                description_mask = (
-                    df["description"].str.contains(
-                        rule["description"], case=False, na=False, regex=True
-                    )
-                    if rule["description"] != ".*"
-                    else True
-                )
-                info_mask = (
-                    df["info"].str.contains(
-                        rule["info"], case=False, na=False, regex=True
-                    )
-                    if rule["info"] != ".*"
-                    else True
-                )
-                amount_mask = (
-                    df["amount"].astype(float) > 0
-                    if rule["amount"] == "pos"
-                    else (
-                        df["amount"].astype(float) < 0
-                        if rule["amount"] == "neg"
-                        else (
-                            df["amount"].astype(float) == 0
-                            if rule["amount"] == "zero"
-                            else True
-                        )
-                    )
-                )
-            except TypeError as e:
-                logging.error(
-                    f"TypeError - apply_categorization {SETTINGS['fixes_file']}: {e}"
-                )
-                logging.error(
-                    f"error - empty cell in {SETTINGS['categories_file']} rule id: {rule['id']}"
-                )
-                raise
-
-            total_mask = account_mask & description_mask & info_mask & amount_mask
-
-            # categorize
-            df.loc[total_mask, "rule_id"] = rule["id"]
-            df.loc[total_mask, "class"] = rule["class"]
-            df.loc[total_mask, "category"] = rule["category"]
-            df.loc[total_mask, "sub_category"] = rule["sub_category"]
+        df = CATEGORIZATION_ENGINES[engine](df, rules_df, context)
 
+        df = apply_schema(df)
         df = df[
             [
                 "date",
@@ -144,16 +337,19 @@ def apply_categorization(df: pd.DataFrame, rules_df: pd.DataFrame) -> pd.DataFra
         raise
 
 
-def categorize_data(df: pd.DataFrame, rules_df: pd.DataFrame) -> pd.DataFrame:
+def categorize_data(
+    df: pd.DataFrame, rules_df: pd.DataFrame, context: dict = None
+) -> pd.DataFrame:
     """
     categorizes the data using the categorization rules.
 
     :param df: dataframe to categorize.
     :param rules_df: dataframe containing the categorization rules.
+    :param context: evaluation context of the rows, reused between runs. if None, built for this run.
     :return: categorized dataframe.
     """
     try:
-        categorized_df = apply_categorization(df, rules_df)
+        categorized_df = apply_categorization(df, rules_df, context=context)
         return categorized_df
     except Exception as e:
         logging.error(f"error - categorize_data: {e}")
@@ -168,10 +364,14 @@ def categorize_data_loop(df: pd.DataFrame, categories_file: str) -> pd.DataFrame
     :param categories_file: path to the csv file containing the categorization rules.
     :return: categorized dataframe.
     """
+    # the rows don't change between rounds, their evaluation context is built once
+    context = {}
     while True:
         categories = load_categorization_rules(categories_file)
         categories_validated = validate_categories(categories)
-        df = categorize_data(df, categories_validated).sort_values(by="description")
+        df = categorize_data(df, categories_validated, context).sort_values(
+            by="description"
+        )
         uncategorized_df = df[df["rule_id"].isna()]
 
         if uncategorized_df.empty:
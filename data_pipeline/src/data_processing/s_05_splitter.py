@@ -1,9 +1,11 @@
+import numpy as np
 import pandas as pd
 import logging
 import os
 
 from config.settings import SETTINGS
 from data_pipeline.src.utils.helpers import save_on_debug
+from data_pipeline.src.utils.schema import apply_schema
 
 
 def create_splits_df(file_path: str) -> pd.DataFrame:
@@ -24,6 +26,85 @@ def create_splits_df(file_path: str) -> pd.DataFrame:
     return splits_df
 
 
+def split_periods(splits_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    returns the distinct split periods of each account. owners sharing an account
+    list the same period, different periods of an account must not overlap.
+
+    :param splits_df: dataframe containing the splits configuration.
+    :return: dataframe with account, start, end and period number, sorted by start.
+    """
+    periods = (
+        splits_df[["account", "start", "end"]]
+        .dropna(subset=["account", "start"])
+        .drop_duplicates()
+        .sort_values(["account", "start", "end"])
+        .reset_index(drop=True)
+    )
+
+    # a period overlaps when it starts before an earlier period of the account ends
+    previous_end = (
+        periods.groupby("account")["end"].cummax().groupby(periods["account"]).shift()
+    )
+    overlapping = periods[periods["start"] <= previous_end]
+    if not overlapping.empty:
+        raise ValueError(
+            f"overlapping split periods in {SETTINGS['splits_file']}: "
+            + ", ".join(
+                f"{row.account} {row.start:%Y-%m-%d} - {row.end:%Y-%m-%d}"
+                for row in overlapping.itertuples()
+            )
+        )
+
+    periods["period"] = np.arange(len(periods))
+    return periods.sort_values("start", kind="stable")
+
+
+def match_splits(df: pd.DataFrame, splits_df: pd.DataFrame) -> tuple:
+    """
+    matches the rows to the splits with an interval join: each row is joined to
+    the split period of its account starting last on or before its date, and
+    kept if the period hasn't ended by then. the rows of a period are matched to
+    each split listing it.
+
+    :param df: dataframe with date and account columns.
+    :param splits_df: dataframe containing the splits configuration.
+    :return: tuple of row positions and split positions, ordered by split and row.
+    """
+    periods = split_periods(splits_df)
+    split_periods_df = splits_df[["account", "start", "end"]].reset_index(drop=True)
+    split_periods_df["split_position"] = np.arange(len(split_periods_df))
+    split_periods_df = split_periods_df.merge(periods, on=["account", "start", "end"])
+
+    rows = pd.DataFrame(
+        {
+            "account": df["account"].astype(object).to_numpy(),
+            "date": df["date"].to_numpy(),
+            "row": np.arange(len(df)),
+        }
+    )
+    rows = rows[rows["account"].isin(periods["account"]) & rows["date"].notna()]
+    matched = pd.merge_asof(
+        rows.sort_values("date", kind="stable"),
+        periods,
+        left_on="date",
+        right_on="start",
+        by="account",
+        direction="backward",
+    )
+    matched = matched[matched["date"] <= matched["end"]]
+
+    pairs = matched[["row", "period"]].merge(
+        split_periods_df[["period", "split_position"]], on="period"
+    )
+    # same order as matching the splits one by one
+    order = np.lexsort((pairs["row"].to_numpy(), pairs["split_position"].to_numpy()))
+    return (
+        pairs["row"].to_numpy(dtype=np.int64)[order],
+        pairs["split_position"].to_numpy(dtype=np.int64)[order],
+    )
+
+
 def split_data(df: pd.DataFrame, splits_df: pd.DataFrame) -> pd.DataFrame:
     """
     splits the data between owners based on the splits configuration dataframe.
@@ -58,35 +139,35 @@ def split_data(df: pd.DataFrame, splits_df: pd.DataFrame) -> pd.DataFrame:
 
         split_dfs = []
 
-        for _, split in splits_df.iterrows():
-            # create a mask to filter rows that match the split criteria
-            mask = (
-                (df["account"] == split["account"])
-                & (df["date"] >= split["start"])
-                & (df["date"] <= split["end"])
-            )
+        if not splits_df.empty:
+            # one row per matched row and split, in a single join
+            rows, split_positions = match_splits(df, splits_df)
+            splits = splits_df.reset_index(drop=True).iloc[split_positions]
 
-            # create a temporary dataframe with the split data
-            temp_df = df[mask].copy()
+            # create a dataframe with the split data
+            temp_df = df.iloc[rows].copy()
 
             try:
                 # adjust the amount and add the owner
-                temp_df["amount"] = temp_df["amount_original"] * split["share"]
-                temp_df["share"] = split["share"]
-                temp_df["owner"] = split["owner"]
+                temp_df["amount"] = (
+                    temp_df["amount_original"].to_numpy() * splits["share"].to_numpy()
+                )
+                temp_df["share"] = splits["share"].to_numpy()
+                temp_df["owner"] = splits["owner"].to_numpy()
                 temp_df["split"] = True  # set the split column to True for split rows
             except TypeError as e:
-                logging.error(f"TypeError - split_data: {split}: {e}")
+                logging.error(f"TypeError - split_data: {SETTINGS['splits_file']}: {e}")
                 raise
 
             split_dfs.append(temp_df)
 
             # mark the original rows as split to exclude them later
-            df.loc[mask, "split"] = True
+            df.iloc[np.unique(rows), df.columns.get_loc("split")] = True
 
         # combine the original dataframe with the split dataframes
         original_df = df[~df["split"]]
         result_df = pd.concat([original_df] + split_dfs, ignore_index=True)
+        result_df = apply_schema(result_df)
 
         logging.info("splits ok")
         save_on_debug(
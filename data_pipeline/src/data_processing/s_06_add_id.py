@@ -2,28 +2,26 @@ import logging
 import os
 import pandas as pd
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import create_id, save_on_debug
+from data_pipeline.src.utils.helpers import create_id_keys, create_ids, save_on_debug
+
+# columns of not_unique_id in order, changing them changes the ids in fixes.csv
+ID_COLUMNS = [
+    "date",
+    "account",
+    "description",
+    "info",
+    "amount_original",
+    "row_type",
+    "source_file",
+    "owner",
+]
 
 
 def add_not_unique_id(df: pd.DataFrame) -> pd.DataFrame:
     try:
-        df["not_unique_id"] = df.apply(
-            lambda row: create_id(
-                pd.Series(
-                    {
-                        "date": row["date"],
-                        "account": row["account"],
-                        "description": row["description"],
-                        "info": row["info"],
-                        "amount_original": row["amount_original"],
-                        "row_type": row["row_type"],
-                        "source_file": row["source_file"],
-                        "owner": row["owner"],
-                    }
-                )
-            ),
-            axis=1,
-        )
+        df["not_unique_id"] = create_ids(df, ID_COLUMNS)
+        # joins and duplicate checks use the key, the id is kept for fixes.csv
+        df["id_key"] = create_id_keys(df["not_unique_id"])
 
         logging.info("id ok")
         save_on_debug(
@@ -1,81 +1,142 @@
+import numpy as np
 import pandas as pd
 import logging
 import os
+import sys
 
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import has_content, save_on_debug
+from data_pipeline.src.utils.helpers import save_on_debug, parse_amounts
+from data_pipeline.src.utils.schema import MONEY_COLUMNS, add_categories
+
+# fixes.csv columns and the data columns they overwrite
+FIX_COLUMNS = {
+    "id": "rule_id",
+    "date": "date",
+    "description": "description",
+    "info": "info",
+    "amount": "amount",
+    "class": "class",
+    "category": "category",
+    "sub_category": "sub_category",
+}
+
+
+def prefix_index(values: pd.Series) -> dict:
+    """
+    builds a prefix index of string values: the values sorted, with their row
+    positions. values starting with the same prefix are next to each other.
+
+    :param values: series of strings, missing values are indexed as empty.
+    :return: dictionary with the sorted values and their row positions.
+    """
+    values = values.fillna("").astype(str).to_numpy(dtype=object)
+    order = np.argsort(values, kind="stable")
+    return {"values": values[order], "positions": order}
+
+
+def prefix_end(prefix: str) -> str:
+    """
+    returns the smallest string sorting after every string starting with the prefix.
+
+    :param prefix: prefix to search.
+    :return: the end of the prefix range, or None if the range has no end.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def find_prefixes(index: dict, prefixes: list) -> tuple:
+    """
+    finds the rows starting with each prefix with a binary search in the prefix index.
+
+    :param index: prefix index from prefix_index.
+    :param prefixes: prefixes to search.
+    :return: tuple of the first matching row position of each prefix in row order (-1 if none) and the number of matching rows.
+    """
+    values = index["values"]
+    prefixes = np.array(prefixes, dtype=object)
+    ends = [prefix_end(prefix) for prefix in prefixes]
+
+    starts = np.searchsorted(values, prefixes, side="left")
+    stops = np.full(len(prefixes), len(values))
+    bounded = np.array([end is not None for end in ends], dtype=bool)
+    if bounded.any():
+        stops[bounded] = np.searchsorted(
+            values,
+            np.array([end for end in ends if end is not None], dtype=object),
+            side="left",
+        )
+    counts = stops - starts
+
+    # smallest row position in each range, the extra 0 is never picked
+    # but lets a range end at the last value
+    bounds = np.column_stack([starts, stops]).ravel()
+    firsts = np.minimum.reduceat(np.append(index["positions"], 0), bounds)[::2]
+    return np.where(counts > 0, firsts, -1), counts
 
 
 def apply_fixes(df: pd.DataFrame, df_fixes: pd.DataFrame) -> pd.DataFrame:
     """
     applies fixes to the dataframe based on the fixes configuration file.
+    each fix is applied to the first row whose not_unique_id starts with its
+    transaction_id, all fixes of a column are written at once.
 
     :param df: dataframe to apply fixes to.
     :param fix_file_path: path to the csv file containing the fixes configuration.
     :return: dataframe with the fixes applied.
     """
-    failed_fixes = []
-
     try:
-        # apply fixes using transaction_id
-        for index, fix in df_fixes.iterrows():
-            try:
-                data_index = df[
-                    df["not_unique_id"].str.startswith(fix["transaction_id"])
-                ].index
+        # fixed values must be valid categories of categorical columns
+        for column in ["class", "category", "sub_category"]:
+            if column in df_fixes.columns:
+                df = add_categories(df, column, df_fixes[column])
 
-                logging.debug(f"applying fix {fix['id']} to: {fix['transaction_id']}")
+        # find the rows of all fixes at once with a prefix index of the ids
+        transaction_ids = [
+            tid if isinstance(tid, str) else "" for tid in df_fixes["transaction_id"]
+        ]
+        index = prefix_index(df["not_unique_id"])
+        positions, counts = find_prefixes(index, transaction_ids)
+        found = (counts > 0) & df_fixes["transaction_id"].notna().to_numpy()
+        failed_fixes = [str(tid) for tid in df_fixes["transaction_id"][~found]]
 
-                if not data_index.empty:
-                    logging.debug(
-                        f"found: {df.at[data_index[0], 'not_unique_id']} from data"
-                    )
-                    # assume user wants to replace the value using fix only if it's set in fix file, else use original
-                    df.at[data_index[0], "rule_id"] = (
-                        fix["id"]
-                        if has_content(fix["id"])
-                        else df.at[data_index[0], "rule_id"]
-                    )
-                    df.at[data_index[0], "date"] = (
-                        fix["date"]
-                        if has_content(fix["date"])
-                        else df.at[data_index[0], "date"]
-                    )
-                    df.at[data_index[0], "description"] = (
-                        fix["description"]
-                        if has_content(fix["description"])
-                        else df.at[data_index[0], "description"]
-                    )
-                    df.at[data_index[0], "info"] = (
-                        fix["info"]
-                        if has_content(fix["info"])
-                        else df.at[data_index[0], "info"]
-                    )
-                    df.at[data_index[0], "amount"] = (
-                        fix["amount"]
-                        if has_content(fix["amount"])
-                        else df.at[data_index[0], "amount"]
-                    )
-                    df.at[data_index[0], "class"] = (
-                        fix["class"]
-                        if has_content(fix["class"])
-                        else df.at[data_index[0], "class"]
+        multiple = found & (counts > 1)
+        if multiple.any():
+            logging.warning(
+                f"fixes matching more than one row in {SETTINGS['fixes_file']}, "
+                "only the first row is fixed, use a longer transaction_id: "
+                + ", ".join(
+                    f"{fix_id} ({count} rows)"
+                    for fix_id, count in zip(
+                        df_fixes["transaction_id"][multiple], counts[multiple]
                     )
-                    df.at[data_index[0], "category"] = (
-                        fix["category"]
-                        if has_content(fix["category"])
-                        else df.at[data_index[0], "category"]
-                    )
-                    df.at[data_index[0], "sub_category"] = (
-                        fix["sub_category"]
-                        if has_content(fix["sub_category"])
-                        else df.at[data_index[0], "sub_category"]
-                    )
-                else:
-                    failed_fixes.append(fix["transaction_id"])
+                )
+            )
+
+        # assume user wants to replace the value using fix only if it's set in fix file, else use original
+        for fix_column, column in FIX_COLUMNS.items():
+            try:
+                values = df_fixes[fix_column]
             except KeyError as e:
                 logging.error(f"fix - KeyError in file {SETTINGS['fixes_file']}: {e}")
                 raise
+            update = found & (values.notna() & (values != "")).to_numpy()
+            if not update.any():
+                continue
+
+            fixed_values = values[update]
+            if column in MONEY_COLUMNS:
+                # amounts are written like in source files, i.e. -12,5
+                fixed_values = parse_amounts(fixed_values)
+
+            # a later fix of the same row wins
+            rows = pd.Series(positions[update])
+            last = ~rows.duplicated(keep="last").to_numpy()
+            df.iloc[rows.to_numpy()[last], df.columns.get_loc(column)] = (
+                fixed_values.to_numpy()[last]
+            )
 
         if failed_fixes:
             logging.error("!\n\nthese fixes failed:\n" + "\n".join(failed_fixes) + "\n")
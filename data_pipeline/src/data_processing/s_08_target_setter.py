@@ -1,62 +1,148 @@
+import numpy as np
 import pandas as pd
 import logging
 import os
-import re
 
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import save_on_debug, clean_string
+from data_pipeline.src.utils.helpers import (
+    save_on_debug,
+    clean_string,
+    create_id_keys,
+    parse_amounts,
+)
+from data_pipeline.src.utils.schema import MONEY_COLUMNS
+
+
+def target_id_suffixes(df_targets: pd.DataFrame) -> list:
+    """
+    creates the part of the target ids after the date, lowercased and cleaned once
+    per target. the date digits in front are kept in the cleaned text so it's
+    cleaned like in the full id.
+
+    :param df_targets: dataframe containing the targets data.
+    :return: list of id suffixes by target.
+    """
+    return [
+        clean_string(
+            f"00000000__target__{target_name}__{monthly_amount}__target__{owner}".lower()
+        )[8:]
+        for target_name, monthly_amount, owner in zip(
+            df_targets["target_name"],
+            df_targets["monthly_target_amount"],
+            df_targets["owner"],
+        )
+    ]
+
+
+def month_ends(starts: pd.Series, ends: pd.Series) -> tuple:
+    """
+    generates the month end dates between start and end dates for all targets at
+    once, the same dates as pd.date_range with freq "M" per target.
+
+    :param starts: start dates of the targets.
+    :param ends: end dates of the targets.
+    :return: tuple of month end dates and the number of month ends by target.
+    """
+    starts = pd.DatetimeIndex(starts)
+    ends = pd.DatetimeIndex(ends)
+    if starts.hasnans or ends.hasnans:
+        raise ValueError("targets need start and end dates")
+
+    def month_end(months: np.ndarray) -> np.ndarray:
+        next_month = (months + 1).astype("datetime64[M]").astype("datetime64[ns]")
+        return next_month - np.timedelta64(1, "D")
+
+    # month ends keep the time of the start date, like in pd.date_range
+    times = (starts - starts.normalize()).to_numpy()
+    first = starts.to_numpy().astype("datetime64[M]").astype(np.int64)
+    last = ends.to_numpy().astype("datetime64[M]").astype(np.int64)
+    last -= month_end(last) + times > ends.to_numpy()
+    counts = np.maximum(last - first + 1, 0)
+
+    targets = np.repeat(np.arange(len(counts)), counts)
+    months = (
+        first[targets]
+        + np.arange(counts.sum())
+        - np.repeat(counts.cumsum() - counts, counts)
+    )
+    return month_end(months) + times[targets], counts
+
+
+def repeat_by_target(values: pd.Series, targets: np.ndarray, empty=None) -> np.ndarray:
+    """
+    repeats the values of the targets for their monthly rows.
+
+    :param values: column of the targets dataframe.
+    :param targets: target position of each monthly row.
+    :param empty: value used for missing values. if None, missing values are kept.
+    :return: array of values by monthly row.
+    """
+    if empty is not None:
+        values = values.where(values.notna(), empty)
+    return values.to_numpy()[targets]
 
 
 def set_targets(df_targets: pd.DataFrame) -> pd.DataFrame:
     """
     splits the monthly target amount into monthly values between start and end date for the last date of each month.
+    the month ends of all targets are generated at once and the other columns are
+    repeated for them, so no row is built one by one.
 
     :param df_targets: dataframe containing the targets data.
     :return: dataframe with monthly target values.
     """
     try:
-        target_rows = []
-
-        for _, row in df_targets.iterrows():
-            target_name = row["target_name"]
-            start_date = pd.to_datetime(row["start"])
-            end_date = pd.to_datetime(row["end"])
-            monthly_amount = row["monthly_target_amount"]
-            owner = row["owner"]
-            target_class = row["class"] if pd.notna(row["class"]) else ""
-            category = row["category"] if pd.notna(row["category"]) else ""
-            sub_category = row["sub_category"] if pd.notna(row["sub_category"]) else ""
-
-            # generate monthly dates between start and end
-            monthly_dates = pd.date_range(start=start_date, end=end_date, freq="M")
-
-            for date in monthly_dates:
-                id = f"{date.strftime('%Y%m%d')}__target__{target_name}__{monthly_amount}__target__{owner}".lower()
-
-                id = clean_string(id)
-
-                target_rows.append(
-                    {
-                        "date": date,
-                        "account": "Target",
-                        "description": target_name,
-                        "info": None,
-                        "amount_original": monthly_amount,
-                        "class": target_class,
-                        "category": category,
-                        "sub_category": sub_category,
-                        "rule_id": target_name,
-                        "source_file": "targets.csv",
-                        "row_type": "Target",
-                        "share": 1,
-                        "amount": monthly_amount,
-                        "owner": owner,
-                        "split": False,
-                        "not_unique_id": id,
-                    }
-                )
-
-        df_monthly_targets = pd.DataFrame(target_rows)
+        # generate monthly dates between start and end, each distinct date text is parsed once
+        dates = pd.concat([df_targets["start"], df_targets["end"]])
+        parsed = {value: pd.to_datetime(value) for value in dates.dropna().unique()}
+        dates, months = month_ends(
+            df_targets["start"].map(parsed), df_targets["end"].map(parsed)
+        )
+
+        if months.sum():
+            # target of each monthly row
+            targets = np.repeat(np.arange(len(df_targets)), months)
+
+            # amounts are written like in source files, i.e. 1000,50. ids use the written amount
+            amounts = repeat_by_target(
+                parse_amounts(df_targets["monthly_target_amount"]), targets
+            )
+            names = repeat_by_target(df_targets["target_name"], targets)
+
+            days = pd.DatetimeIndex(dates)
+            date_ids = days.year * 10000 + days.month * 100 + days.day
+            ids = (
+                date_ids.astype(str).to_numpy(dtype=object)
+                + np.array(target_id_suffixes(df_targets), dtype=object)[targets]
+            )
+
+            df_monthly_targets = pd.DataFrame(
+                {
+                    "date": dates,
+                    "account": "Target",
+                    "description": names,
+                    "info": None,
+                    "amount_original": amounts,
+                    "class": repeat_by_target(df_targets["class"], targets, ""),
+                    "category": repeat_by_target(df_targets["category"], targets, ""),
+                    "sub_category": repeat_by_target(
+                        df_targets["sub_category"], targets, ""
+                    ),
+                    "rule_id": names,
+                    "source_file": "targets.csv",
+                    "row_type": "Target",
+                    "share": 1,
+                    "amount": amounts,
+                    "owner": repeat_by_target(df_targets["owner"], targets),
+                    "split": False,
+                    "not_unique_id": ids,
+                }
+            ).infer_objects()
+            df_monthly_targets["id_key"] = create_id_keys(
+                df_monthly_targets["not_unique_id"]
+            )
+        else:
+            df_monthly_targets = pd.DataFrame([])
         logging.debug(f"targets ok: {df_monthly_targets.shape[0]} rows")
 
         save_on_debug(
@@ -68,3 +154,25 @@ def set_targets(df_targets: pd.DataFrame) -> pd.DataFrame:
     except Exception as e:
         logging.error(f"error - split_monthly_targets: {e}")
         raise
+
+
+def format_target_amounts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    formats whole target amounts without decimals for writing final_data.csv,
+    i.e. 1000 instead of 1000.0, like they are written in targets.csv. other rows
+    keep their float amounts.
+
+    :param df: dataframe with row_type and money columns.
+    :return: dataframe with target amounts formatted.
+    """
+    targets = (df["row_type"] == "Target").to_numpy()
+    if not targets.any():
+        return df
+
+    for column in MONEY_COLUMNS:
+        amounts = df[column]
+        whole = targets & (amounts % 1 == 0).to_numpy()
+        values = amounts.astype(object)
+        values[whole] = amounts[whole].astype(np.int64).astype(object)
+        df[column] = values
+    return df
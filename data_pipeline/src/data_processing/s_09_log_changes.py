@@ -4,7 +4,8 @@ import pandas as pd
 from datetime import datetime
 
 from config.settings import SETTINGS
-from data_pipeline.src.utils.helpers import write_to_csv
+from data_pipeline.src.utils.helpers import create_id_keys, id_keys, write_to_csv
+from data_pipeline.src.utils.schema import release_schema
 
 
 from typing import Tuple
@@ -125,6 +126,7 @@ def log_categorization_and_id_changes(
 ):
     """
     compares df_new against final_data.csv and logs changes in "class", "category", and "sub_category" by not_unique_id.
+    rows are joined on the 64-bit key of not_unique_id.
     saves changes to intermediate/df_categorization_changes.csv and logs changes to the console.
 
     :param df_new: the final dataframe from the pipeline.
@@ -134,16 +136,18 @@ def log_categorization_and_id_changes(
     try:
         df_current, is_migration = add_dummy_not_unique_id(df_current)
 
-        # merge df_new with df_current on not_unique_id
-        merged_df = df_current.merge(
-            df_new,
-            on="not_unique_id",
+        # merge df_new with df_current on the key of not_unique_id
+        merged_df = df_current.assign(
+            id_key=create_id_keys(df_current["not_unique_id"])
+        ).merge(
+            df_new.assign(id_key=id_keys(df_new)).drop(columns=["not_unique_id"]),
+            on="id_key",
             suffixes=("_current", "_new"),
             how="left",
         )
 
         # fill NaN values with a placeholder to ensure correct comparison
-        merged_df = merged_df.fillna("")
+        merged_df = release_schema(merged_df).fillna("")
 
         # compare the relevant columns
         df_changes = merged_df[
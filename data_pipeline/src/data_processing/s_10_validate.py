@@ -4,6 +4,8 @@ import logging
 import pandas as pd
 from datetime import datetime
 
+from data_pipeline.src.utils.helpers import create_id_keys, id_keys
+
 
 def load_accepted_duplicates(accepted_file_path: str) -> pd.DataFrame:
     """
@@ -25,14 +27,17 @@ def validate_not_unique_id(df_final: pd.DataFrame, output_dir: str):
     """
     ensures not_unique_id is unique in df_final. if new duplicates are found,
     prompts the user to accept or reject them. already accepted duplicates are read
-    from accepted_duplicates.csv and won't be prompted again.
+    from accepted_duplicates.csv and won't be prompted again. ids are compared by
+    their 64-bit key.
     """
     try:
         # filter out rows with amount == 0
         df_final = df_final[df_final["amount"] != 0]
 
         # identify duplicates of not_unique_id
-        duplicates = df_final[df_final["not_unique_id"].duplicated(keep=False)]
+        keys = id_keys(df_final)
+        duplicated = keys.duplicated(keep=False)
+        duplicates = df_final[duplicated]
 
         # if no duplicates, we can skip the rest
         if duplicates.empty:
@@ -47,9 +52,8 @@ def validate_not_unique_id(df_final: pd.DataFrame, output_dir: str):
         df_accepted = load_accepted_duplicates(accepted_duplicates_file)
 
         # filter out duplicates that were already accepted
-        new_duplicates = duplicates[
-            ~duplicates["not_unique_id"].isin(df_accepted["not_unique_id"])
-        ]
+        accepted = keys.isin(create_id_keys(df_accepted["not_unique_id"]))
+        new_duplicates = df_final[duplicated & ~accepted]
 
         # if no new duplicates, skip prompting
         if new_duplicates.empty:
@@ -59,7 +63,9 @@ def validate_not_unique_id(df_final: pd.DataFrame, output_dir: str):
         # save new duplicates to a timestamped file for review
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         duplicates_file_path = os.path.join(output_dir, f"duplicates_{timestamp}.csv")
-        new_duplicates.to_csv(duplicates_file_path, index=False)
+        new_duplicates.drop(columns=["id_key"], errors="ignore").to_csv(
+            duplicates_file_path, index=False
+        )
 
         logging.warning(
             f"!\n\nnew duplicates found: {len(new_duplicates)}"
@@ -7,6 +7,7 @@ import time
 from config.settings import SETTINGS
 from data_pipeline.src.utils.logger import setup_logging
 from data_pipeline.src.utils.helpers import write_to_csv, clean_folder
+from data_pipeline.src.utils.schema import apply_schema
 
 from data_pipeline.src.source_file_reader.s_01_files_csv_to_yml import (
     csv_to_yml,
@@ -25,7 +26,10 @@ from data_pipeline.src.data_processing.s_04_categorizer import categorize_data_l
 from data_pipeline.src.data_processing.s_05_splitter import split_data, create_splits_df
 from data_pipeline.src.data_processing.s_06_add_id import add_not_unique_id
 from data_pipeline.src.data_processing.s_07_fixer import apply_fixes
-from data_pipeline.src.data_processing.s_08_target_setter import set_targets
+from data_pipeline.src.data_processing.s_08_target_setter import (
+    set_targets,
+    format_target_amounts,
+)
 from data_pipeline.src.data_processing.s_09_log_changes import (
     log_categorization_and_id_changes,
 )
@@ -108,6 +112,8 @@ def main(debug):
             logging.info("use targets: disabled")
             df_final = df_fixed
 
+        df_final = apply_schema(df_final)
+
         # log data changes
         df_current = read_csv_file(SETTINGS["final_result_file"])
         log_categorization_and_id_changes(
@@ -117,8 +123,12 @@ def main(debug):
         # validation
         validate_not_unique_id(df_final, SETTINGS["duplicates_folder"])
 
-        # save final data with fixes
-        df_final = df_final.sort_values(by="date", ascending=False)
+        # save final data with fixes, id_key is created again from not_unique_id
+        df_final = df_final.drop(columns=["id_key"]).sort_values(
+            by="date", ascending=False
+        )
+        # whole target amounts are written like in targets.csv, i.e. 1000
+        df_final = format_target_amounts(df_final)
         write_to_csv(df_final, SETTINGS["final_result_file"])
         logging.info("great success!")
 
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import re
+import yaml
+
+from config.settings import SETTINGS
+from data_pipeline.src.utils.cache import (
+    file_signature,
+    load_json_cache,
+    save_json_cache,
+)
+
+REQUIRED_PROPERTIES = [
+    "id",
+    "pattern",
+    "account",
+    "delimiter",
+    "date_format",
+    "day_first",
+    "columns",
+]
+REQUIRED_COLUMNS = ["date", "amount", "description", "info"]
+
+# registries by absolute yml directory, reused while the .yml files are unchanged
+_registries = {}
+
+
+def validate_config(file_name: str, config: dict):
+    """
+    validates that a .yml config has the required properties and columns.
+
+    :param file_name: name of the .yml file, used in the error message.
+    :param config: dictionary containing the .yml data.
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"file {file_name} has errors:\nnot a valid .yml mapping")
+
+    missing_properties = [prop for prop in REQUIRED_PROPERTIES if prop not in config]
+    columns = config.get("columns") or {}
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+
+    if missing_properties or missing_columns:
+        error_message = f"\nfile {file_name} has errors:\n"
+        if missing_properties:
+            error_message += f"missing properties: {', '.join(missing_properties)}\n"
+        if missing_columns:
+            error_message += f"missing columns: {', '.join(missing_columns)}"
+        raise ValueError(error_message.strip())
+
+
+def compile_dispatch(configs: dict) -> dict:
+    """
+    compiles the file name patterns of all configs.
+
+    patterns are combined into a single regex with one named group per config, so a
+    file name is matched against all configs at once. alternatives are tried in
+    order, so the first matching config wins like with separate re.match calls.
+    patterns using their own groups can't be combined safely and are matched one by one.
+
+    :param configs: dictionary of configs by .yml file name.
+    :return: dictionary with the combined regex, group names and single patterns.
+    """
+    file_names = list(configs.keys())
+    patterns = [re.compile(configs[name]["pattern"]) for name in file_names]
+
+    combined = None
+    if patterns and all(pattern.groups == 0 for pattern in patterns):
+        try:
+            combined = re.compile(
+                "|".join(
+                    f"(?P<c{i}>{pattern.pattern})" for i, pattern in enumerate(patterns)
+                )
+            )
+        except re.error:
+            combined = None
+
+    return {"combined": combined, "file_names": file_names, "patterns": patterns}
+
+
+def load_config_registry(yml_directory: str) -> dict:
+    """
+    loads and validates all .yml configs in a directory.
+
+    configs are parsed once and kept in memory and in the config registry cache
+    file. only .yml files that are new or changed since the last load are parsed
+    again, detected by file size and modification time.
+
+    :param yml_directory: directory containing the .yml files.
+    :return: dictionary with configs and content hashes by .yml file name and the compiled dispatch.
+    """
+    try:
+        directory = os.path.abspath(yml_directory)
+        signatures = {
+            file_name: file_signature(os.path.join(directory, file_name))
+            for file_name in sorted(os.listdir(directory))
+            if file_name.endswith(".yml")
+        }
+
+        registry = _registries.get(directory)
+        if registry is not None and registry["signatures"] == signatures:
+            return registry
+
+        cache_file = SETTINGS["config_registry_cache_file"]
+        cache = load_json_cache(cache_file)
+        cached = cache.get(directory, {"signatures": {}, "configs": {}, "hashes": {}})
+
+        configs = {}
+        hashes = {}
+        parsed = 0
+        for file_name, signature in signatures.items():
+            if cached["signatures"].get(file_name) == signature:
+                configs[file_name] = cached["configs"][file_name]
+                hashes[file_name] = cached["hashes"][file_name]
+                continue
+
+            with open(os.path.join(directory, file_name), "rb") as f:
+                content = f.read()
+            config = yaml.safe_load(content.decode("utf-8"))
+            validate_config(file_name, config)
+            configs[file_name] = config
+            hashes[file_name] = hashlib.sha256(content).hexdigest()
+            parsed += 1
+
+        registry = {
+            "signatures": signatures,
+            "configs": configs,
+            "hashes": hashes,
+            "dispatch": compile_dispatch(configs),
+        }
+        _registries[directory] = registry
+
+        if parsed or len(cached["signatures"]) != len(signatures):
+            cache[directory] = {
+                "signatures": signatures,
+                "configs": configs,
+                "hashes": hashes,
+            }
+            save_json_cache(cache_file, cache)
+
+        logging.debug(f"config registry: {len(configs)} .yml files, {parsed} parsed")
+        return registry
+    except Exception as e:
+        logging.error(f"error - load_config_registry {yml_directory}: {e}")
+        raise
+
+
+def match_config(registry: dict, file_name: str) -> tuple:
+    """
+    finds the config whose pattern matches the file name.
+
+    :param registry: config registry from load_config_registry.
+    :param file_name: name of the source file.
+    :return: tuple of .yml file name and config, or (None, None) if nothing matches.
+    """
+    dispatch = registry["dispatch"]
+
+    if dispatch["combined"] is not None:
+        match = dispatch["combined"].match(file_name)
+        if match is None:
+            return None, None
+        yml_file = dispatch["file_names"][int(match.lastgroup[1:])]
+        return yml_file, registry["configs"][yml_file]
+
+    for yml_file, pattern in zip(dispatch["file_names"], dispatch["patterns"]):
+        if pattern.match(file_name):
+            return yml_file, registry["configs"][yml_file]
+    return None, None
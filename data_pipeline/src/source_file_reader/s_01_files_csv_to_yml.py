@@ -5,6 +5,8 @@ import yaml
 import ast
 from collections import OrderedDict
 
+from data_pipeline.src.source_file_reader.config_registry import load_config_registry
+
 
 def quoted_presenter(dumper, data):
     return dumper.represent_scalar("tag:yaml.org,2002:str", data, style='"')
@@ -32,12 +34,14 @@ def csv_to_yml(df: pd.DataFrame, yml_directory: str):
         # ensure the yml directory exists
         os.makedirs(yml_directory, exist_ok=True)
 
+        existing_configs = load_config_registry(yml_directory)["configs"]
+
         for _, row in df.iterrows():
             pattern = row["pattern"]
             yml_file_path = os.path.join(yml_directory, f"{pattern}.yml")
 
             # check if the .yml file already exists
-            if not os.path.exists(yml_file_path):
+            if f"{pattern}.yml" not in existing_configs:
                 # parse the columns field
                 columns = ast.literal_eval(row["columns"])
 
@@ -105,48 +109,12 @@ def csv_to_yml(df: pd.DataFrame, yml_directory: str):
 def validate_yml_files(yml_directory: str):
     """
     validates all .yml files in the specified directory to ensure they have the required properties.
+    validation is done when the config registry loads the files, so the parsed configs are reused later.
 
     :param yml_directory: directory containing the .yml files.
     """
-    required_properties = [
-        "id",
-        "pattern",
-        "account",
-        "delimiter",
-        "date_format",
-        "day_first",
-        "columns",
-    ]
-    required_columns = ["date", "amount", "description", "info"]
-
     try:
-        for file_name in os.listdir(yml_directory):
-            if file_name.endswith(".yml"):
-                yml_file_path = os.path.join(yml_directory, file_name)
-                with open(yml_file_path, "r", encoding="utf-8") as yml_file:
-                    yml_data = yaml.safe_load(yml_file)
-
-                missing_properties = [
-                    prop for prop in required_properties if prop not in yml_data
-                ]
-                missing_columns = [
-                    col for col in required_columns if col not in yml_data["columns"]
-                ]
-
-                if missing_properties or missing_columns:
-                    error_message = (
-                        f"\nfile {os.path.basename(yml_file_path)} has errors:\n"
-                    )
-                    if missing_properties:
-                        error_message += (
-                            f"missing properties: {', '.join(missing_properties)}\n"
-                        )
-                    if missing_columns:
-                        error_message += (
-                            f"missing columns: {', '.join(missing_columns)}"
-                        )
-                    raise ValueError(error_message.strip())
-
+        load_config_registry(yml_directory)
         logging.info("ok - all .yml files")
     except Exception as e:
         logging.error(f"error - validate_yml_files: {e}")
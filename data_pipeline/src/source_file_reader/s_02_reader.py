@@ -1,11 +1,85 @@
+import datetime
 import logging
 import os
+import numpy as np
 import pandas as pd
-import re
 import yaml
 
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from openpyxl import load_workbook
 from pprint import pformat
-from data_pipeline.src.utils.helpers import detect_encoding
+
+from config.settings import SETTINGS
+from data_pipeline.src.utils.helpers import detect_encoding, save_encoding_cache
+from data_pipeline.src.utils.cache import (
+    frame_warnings_path,
+    load_frame,
+    load_json_cache,
+    parse_cache_key,
+    prune_frames,
+    save_file_hash_cache,
+)
+from data_pipeline.src.source_file_reader.config_registry import (
+    load_config_registry,
+    match_config,
+)
+
+# number of excel rows converted to a dataframe at a time
+EXCEL_CHUNK_ROWS = 10000
+
+# excel cell texts read as missing values, the default na values of pandas readers
+NA_VALUES = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+
+def get_csv_engine() -> str:
+    """
+    returns the csv engine to try first, based on settings.
+
+    the c engine is the default. pyarrow is not supported, it reads empty cells,
+    unnamed and duplicate columns differently, which changes the row ids.
+
+    :return: name of the pandas csv engine.
+    """
+    engine = SETTINGS["csv_engine"]
+    if engine not in ["c", "python"]:
+        raise ValueError(f"unknown csv engine: {engine}, use c or python")
+    return engine
+
+
+def normalize_delimiter(delimiter: str) -> str:
+    """
+    converts an escaped delimiter like '\\t' from .yml files to the actual character.
+    the python engine reads these as regex, the c engine needs a single character.
+
+    :param delimiter: delimiter from the config.
+    :return: delimiter as a single character if possible, else unchanged.
+    """
+    if isinstance(delimiter, str) and len(delimiter) > 1 and delimiter.isascii():
+        unescaped = delimiter.encode("ascii").decode("unicode_escape")
+        if len(unescaped) == 1:
+            return unescaped
+    return delimiter
 
 
 def read_csv_file(
@@ -14,6 +88,9 @@ def read_csv_file(
     """
     reads a csv file and returns a dataframe.
 
+    tries the fast csv engine first and falls back to the python engine if the fast
+    engine can't handle the delimiter or quoting of the file.
+
     :param file_path: path to the csv file.
     :param encoding: encoding of the csv file. if None, detect encoding.
     :param delimiter: delimiter of the csv file. default is ','.
@@ -23,14 +100,36 @@ def read_csv_file(
         if encoding is None:
             encoding = detect_encoding(file_path)
 
-        logging.info(f"read csv: {os.path.basename(file_path)} ({encoding})")
-        df = pd.read_csv(
-            file_path,
-            encoding=encoding,
-            delimiter=delimiter,
-            dtype=str,
-            engine="python",
-        )
+        engine = get_csv_engine()
+        df = None
+
+        if engine != "python":
+            try:
+                df = pd.read_csv(
+                    file_path,
+                    encoding=encoding,
+                    delimiter=normalize_delimiter(delimiter),
+                    dtype=str,
+                    engine=engine,
+                )
+            except UnicodeDecodeError:
+                raise
+            except (ValueError, pd.errors.ParserError) as e:
+                logging.debug(
+                    f"-> {engine} engine failed: {os.path.basename(file_path)}: {e}"
+                )
+                engine = "python"
+
+        if df is None:
+            df = pd.read_csv(
+                file_path,
+                encoding=encoding,
+                delimiter=delimiter,
+                dtype=str,
+                engine="python",
+            )
+
+        logging.info(f"read csv: {os.path.basename(file_path)} ({encoding}, {engine})")
         logging.debug(f"-> ok: {os.path.basename(file_path)}")
         return df
     except UnicodeDecodeError as e:
@@ -41,16 +140,140 @@ def read_csv_file(
         raise
 
 
-def read_excel_file(file_path: str) -> pd.DataFrame:
+def convert_excel_value(value):
+    """
+    converts an excel cell value to a string the same way as pd.read_excel(dtype=str).
+
+    :param value: cell value from openpyxl.
+    :return: the value as a string, or NaN for empty and missing values.
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, float):
+        # whole numbers are read as integers, i.e. 1.0 -> "1"
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, (int, datetime.datetime, datetime.date, datetime.time)):
+        return str(value)
+    if value in NA_VALUES:
+        return np.nan
+    return str(value)
+
+
+def excel_columns(header: list) -> list:
+    """
+    creates the column names from an excel header row the same way as pd.read_excel.
+
+    empty cells are named 'Unnamed: i', whole numbers are read as integers and
+    duplicate names get a counter, i.e. a, a -> a, a.1. named columns get their
+    counter before unnamed ones.
+
+    :param header: values of the header row from openpyxl.
+    :return: list of column names.
+    """
+    columns = []
+    unnamed = []
+    for i, name in enumerate(header):
+        if name is None or name == "":
+            columns.append(f"Unnamed: {i}")
+            unnamed.append(i)
+        elif isinstance(name, float) and name.is_integer():
+            columns.append(int(name))
+        else:
+            columns.append(name)
+
+    counts = defaultdict(int)
+    named = [i for i in range(len(columns)) if i not in unnamed]
+    for i in named + unnamed:
+        name = columns[i]
+        count = counts[name]
+        while count > 0:
+            counts[columns[i]] = count + 1
+            name = f"{columns[i]}.{count}"
+            count = count + 1 if name in columns else counts[name]
+        columns[i] = name
+        counts[name] = count + 1
+    return columns
+
+
+def iter_excel_chunks(
+    file_path: str,
+    sheet=None,
+    header_row: int = 1,
+    chunk_size: int = EXCEL_CHUNK_ROWS,
+):
+    """
+    reads an excel sheet in read-only mode and yields the rows as dataframes of chunk_size rows.
+
+    only cell values of the selected sheet are read, styles and other sheets are not loaded.
+    values are converted to strings and columns are named like pd.read_excel(dtype=str)
+    does. the header row sets the columns, cells right of the header are not read.
+
+    :param file_path: path to the excel file.
+    :param sheet: sheet name or 0-based index. if None, use the first sheet.
+    :param header_row: 1-based row number of the header row.
+    :param chunk_size: number of rows in each yielded dataframe.
+    :return: generator of dataframes.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        if sheet is None:
+            worksheet = workbook.worksheets[0]
+        elif isinstance(sheet, int):
+            worksheet = workbook.worksheets[sheet]
+        else:
+            worksheet = workbook[sheet]
+
+        # dimensions saved by some exporters are wrong, read the actual rows instead
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(min_row=header_row, values_only=True)
+
+        header = list(next(rows, ()))
+        while header and header[-1] is None:
+            header.pop()
+        columns = excel_columns(header)
+        width = len(columns)
+
+        chunk = []
+        empty_rows = []
+        yielded = False
+        for row in rows:
+            values = [convert_excel_value(value) for value in row[:width]]
+            values += [np.nan] * (width - len(values))
+
+            # keep empty rows only if data follows, like pd.read_excel. a cell with
+            # a missing value text like NA is not empty
+            if all(value is None or value == "" for value in row[:width]):
+                empty_rows.append(values)
+                continue
+            chunk.extend(empty_rows)
+            empty_rows = []
+            chunk.append(values)
+
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                yielded = True
+                chunk = []
+
+        # a sheet without data rows still gives an empty dataframe with the columns
+        if chunk or not yielded:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def read_excel_file(file_path: str, sheet=None, header_row: int = None) -> pd.DataFrame:
     """
     reads an excel file and returns a dataframe.
 
     :param file_path: path to the excel file.
+    :param sheet: sheet name or 0-based index. if None, use the first sheet.
+    :param header_row: 1-based row number of the header row. if None, use the first row.
     :return: dataframe containing the excel data.
     """
     try:
         logging.info(f"read excel: {os.path.basename(file_path)}")
-        df = pd.read_excel(file_path, dtype=str)
+        chunks = list(iter_excel_chunks(file_path, sheet, header_row or 1))
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
         logging.debug(f"-> ok: {os.path.basename(file_path)}")
         return df
     except Exception as e:
@@ -91,73 +314,182 @@ def collect_files(input_folder: str, yml_directory: str) -> dict:
             if os.path.isfile(os.path.join(input_folder, file)) and "~" not in file
         ]  # exclude directories and temporary files
 
-        yml_files = [
-            os.path.join(yml_directory, file)
-            for file in os.listdir(yml_directory)
-            if file.endswith(".yml")
-        ]
+        registry = load_config_registry(yml_directory)
 
         for file in files_to_process:
             file_path = os.path.join(input_folder, file)
-            matched = False
-
-            for yml_file in yml_files:
-                config = read_yaml_file(yml_file)
-                pattern = config.get("pattern")
-
-                if re.match(pattern, file):
-                    file_info[file_path] = {
-                        "file_name": file,
-                        "account": config.get("account"),
-                        "encoding": detect_encoding(file_path),
-                        "file_path": file_path,
-                        "pattern": f"{pattern}",
-                        "delimiter": config.get("delimiter"),
-                        "date_format": config.get("date_format"),
-                        "day_first": config.get("day_first"),
-                        "columns": config.get("columns"),
-                    }
-                    matched = True
-
-                    logging.debug(
-                        f"config found: {os.path.basename(file_path)}\n"
-                        + f"properties:\n{pformat(file_info[file_path])}"
-                    )
-                    break
-
-            if not matched:
+            yml_file, config = match_config(registry, file)
+
+            if config is None:
                 raise ValueError(
                     f"no pattern found for {file}. add .yml file to configuration files"
                 )
 
+            file_info[file_path] = {
+                "file_name": file,
+                "account": config.get("account"),
+                "encoding": detect_encoding(file_path, save_cache=False),
+                "file_path": file_path,
+                "pattern": f"{config.get('pattern')}",
+                "delimiter": config.get("delimiter"),
+                "date_format": config.get("date_format"),
+                "day_first": config.get("day_first"),
+                "columns": config.get("columns"),
+                "config_hash": registry["hashes"][yml_file],
+                "decimal_separator": config.get("decimal_separator"),
+                "thousands_separator": config.get("thousands_separator"),
+                "minus_signs": config.get("minus_signs"),
+                "sheet": config.get("sheet"),
+                "header_row": config.get("header_row"),
+            }
+
+            logging.debug(
+                f"config found: {os.path.basename(file_path)} ({yml_file})\n"
+                + f"properties:\n{pformat(file_info[file_path])}"
+            )
+
         logging.info(f"found files: {len(file_info)}")
         return file_info
     except Exception as e:
         logging.error(f"error - collect_files {input_folder}: {e}")
         raise
+    finally:
+        # new encodings of all files are saved at once
+        save_encoding_cache()
 
 
-def read_collected_files(file_info: dict) -> dict:
+def read_source_file(file_path: str, info: dict) -> pd.DataFrame:
+    """
+    reads a single source file based on its file information.
+
+    :param file_path: path to the source file.
+    :param info: file information from collect_files.
+    :return: dataframe containing the file data.
+    """
+    if info["file_name"].endswith(".csv"):
+        return read_csv_file(
+            file_path, encoding=info["encoding"], delimiter=info["delimiter"]
+        )
+    elif info["file_name"].endswith(".xlsx"):
+        return read_excel_file(file_path, info.get("sheet"), info.get("header_row"))
+    else:
+        logging.warning(f"unsupported file type: {file_path}")
+        raise ValueError(f"unsupported file type: {file_path}")
+
+
+def load_parsed_files(file_info: dict) -> dict:
+    """
+    loads already parsed and normalized dataframes from the parse cache.
+
+    sets a cache_key to the props of every file, so append_dataframes can store
+    the files that were not found in the cache. cached dataframes of files that
+    are no longer read with the same content and config are removed.
+
+    :param file_info: dictionary containing file information.
+    :return: dictionary containing cached dataframes by file path.
+    """
+    cached = {}
+    for file_path, info in file_info.items():
+        try:
+            info["cache_key"] = parse_cache_key(
+                file_path, info, SETTINGS["file_hash_cache_file"]
+            )
+        except OSError as e:
+            # leave unreadable files to read_source_file, it reports the error
+            logging.debug(f"no parse cache key: {os.path.basename(file_path)}: {e}")
+            continue
+
+        df = load_frame(SETTINGS["parse_cache_folder"], info["cache_key"])
+        if df is not None:
+            # warnings of the normalization are logged again by append_dataframes
+            warnings = load_json_cache(
+                frame_warnings_path(SETTINGS["parse_cache_folder"], info["cache_key"])
+            )
+            cached[file_path] = {
+                "dataframe": df,
+                "props": info,
+                "normalized": True,
+                "warnings": warnings.get("warnings", []),
+            }
+
+    # new hashes of all files are saved at once
+    save_file_hash_cache(SETTINGS["file_hash_cache_file"])
+    prune_frames(
+        SETTINGS["parse_cache_folder"],
+        {info["cache_key"] for info in file_info.values() if info.get("cache_key")},
+    )
+    logging.info(f"parse cache: {len(cached)}/{len(file_info)} files unchanged")
+    return cached
+
+
+def read_collected_files(
+    file_info: dict, workers: int = None, use_cache: bool = None
+) -> dict:
     """
     reads files based on the provided file information.
 
+    with more than one worker each file is read in its own process. the returned
+    dictionary keeps the order of file_info regardless of which file finishes first.
+    files found in the parse cache are not read, their dataframes are marked normalized.
+
     :param file_info: dictionary containing file information.
+    :param workers: number of processes used for reading. if None, use settings.
+    :param use_cache: whether to use the parse cache. if None, use settings.
     :return: dictionary containing dataframes of the read files.
     """
+    if workers is None:
+        workers = SETTINGS["read_workers"]
+    if use_cache is None:
+        use_cache = SETTINGS["use_parse_cache"]
+
+    cached = load_parsed_files(file_info) if use_cache else {}
+    files_to_read = [file_path for file_path in file_info if file_path not in cached]
+
+    if workers <= 1 or len(files_to_read) <= 1:
+        dataframes = {}
+        for file_path, info in file_info.items():
+            if file_path in cached:
+                dataframes[file_path] = cached[file_path]
+                continue
+            try:
+                df = read_source_file(file_path, info)
+                dataframes[file_path] = {"dataframe": df, "props": info}
+            except Exception as e:
+                logging.error(f"error - read_collected_files {file_path}: {e}")
+                raise
+        return dataframes
+
+    logging.info(f"read files in parallel: {workers} workers")
     dataframes = {}
-    for file_path, info in file_info.items():
-        try:
-            if info["file_name"].endswith(".csv"):
-                df = read_csv_file(
-                    file_path, encoding=info["encoding"], delimiter=info["delimiter"]
-                )
-            elif info["file_name"].endswith(".xlsx"):
-                df = read_excel_file(file_path)
-            else:
-                logging.warning(f"unsupported file type: {file_path}")
-                raise ValueError(f"unsupported file type: {file_path}")
-            dataframes[file_path] = {"dataframe": df, "props": info}
-        except Exception as e:
-            logging.error(f"error - read_collected_files {file_path}: {e}")
-            raise
+    failed_files = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            file_path: executor.submit(
+                read_source_file, file_path, file_info[file_path]
+            )
+            for file_path in files_to_read
+        }
+
+        # collect results in file_info order so the output is deterministic
+        for file_path in file_info:
+            if file_path in cached:
+                dataframes[file_path] = cached[file_path]
+                continue
+            try:
+                df = futures[file_path].result()
+                dataframes[file_path] = {
+                    "dataframe": df,
+                    "props": file_info[file_path],
+                }
+            except Exception as e:
+                logging.error(f"error - read_collected_files {file_path}: {e}")
+                failed_files.append(os.path.basename(file_path))
+
+    if failed_files:
+        logging.error("!\n\nthese files failed:\n" + "\n".join(failed_files) + "\n")
+        raise ValueError(
+            f"{len(failed_files)} files failed to read: {', '.join(failed_files)}"
+        )
+
     return dataframes
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    PYARROW_INSTALLED = True
+except ImportError:
+    PYARROW_INSTALLED = False
+
+# bump when the stage 3 normalization of source files changes, invalidates parsed frames
+PARSE_CACHE_VERSION = 1
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# names of the cached dataframes and their warnings, by sha256 cache key
+FRAME_CACHE_FILE = re.compile(r"([0-9a-f]{64})\.(parquet|pkl|warnings\.json)")
+
+# content hashes by absolute file path, loaded from the file hash cache file once
+_file_hash_cache = {}
+# hash cache files with entries not saved yet
+_file_hash_cache_changed = set()
+
+
+def file_signature(file_path: str) -> dict:
+    """
+    returns the size and modification time of a file, used to detect file changes.
+
+    :param file_path: path to the file.
+    :return: dictionary with size and mtime of the file.
+    """
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def load_json_cache(cache_file: str) -> dict:
+    """
+    loads a json cache file. a missing or broken cache is treated as empty.
+
+    :param cache_file: path to the cache file.
+    :return: dictionary containing the cached data.
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"cache ignored {os.path.basename(cache_file)}: {e}")
+        return {}
+
+
+def save_json_cache(cache_file: str, data: dict):
+    """
+    saves data to a json cache file. writes to a temporary file first so a
+    crash never leaves a half written cache behind.
+
+    :param cache_file: path to the cache file.
+    :param data: dictionary to save.
+    """
+    if not cache_file:
+        return
+
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_file, cache_file)
+        logging.debug(f"cache saved: {os.path.basename(cache_file)}")
+    except (OSError, TypeError, ValueError) as e:
+        # cache is an optimization, failing to save it must not stop the pipeline.
+        # i.e. a .yml date value like 2024-01-01 is not json serializable
+        logging.warning(f"cache not saved {os.path.basename(cache_file)}: {e}")
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def file_hash(file_path: str, cache_file: str = None) -> str:
+    """
+    returns the sha256 hash of a file's content.
+
+    hashes are cached by path, size and modification time in cache_file, so
+    unchanged files are not read again on later runs. new hashes are kept in
+    memory until save_file_hash_cache is called.
+
+    :param file_path: path to the file.
+    :param cache_file: path to the hash cache file. if None, don't cache.
+    :return: hex digest of the file content.
+    """
+    key = os.path.abspath(file_path)
+    signature = file_signature(file_path)
+
+    if cache_file:
+        if cache_file not in _file_hash_cache:
+            _file_hash_cache[cache_file] = load_json_cache(cache_file)
+        cached = _file_hash_cache[cache_file].get(key)
+        if cached and all(cached.get(k) == v for k, v in signature.items()):
+            return cached["hash"]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    if cache_file:
+        _file_hash_cache[cache_file][key] = {**signature, "hash": content_hash}
+        _file_hash_cache_changed.add(cache_file)
+
+    return content_hash
+
+
+def save_file_hash_cache(cache_file: str):
+    """
+    saves the file hashes to the hash cache file if there are new ones.
+
+    :param cache_file: path to the hash cache file.
+    """
+    if cache_file in _file_hash_cache_changed:
+        save_json_cache(cache_file, _file_hash_cache[cache_file])
+        _file_hash_cache_changed.discard(cache_file)
+
+
+def frame_cache_path(cache_folder: str, key: str) -> str:
+    """
+    returns the path of a cached dataframe. parquet is used when pyarrow is
+    installed, else pickle.
+
+    :param cache_folder: folder containing the cached dataframes.
+    :param key: cache key of the dataframe.
+    :return: path to the cached dataframe file.
+    """
+    extension = "parquet" if PYARROW_INSTALLED else "pkl"
+    return os.path.join(cache_folder, f"{key}.{extension}")
+
+
+def frame_warnings_path(cache_folder: str, key: str) -> str:
+    """
+    returns the path of the warnings logged when a cached dataframe was created.
+
+    :param cache_folder: folder containing the cached dataframes.
+    :param key: cache key of the dataframe.
+    :return: path to the warnings json file.
+    """
+    return os.path.join(cache_folder, f"{key}.warnings.json")
+
+
+def prune_frames(cache_folder: str, keys: set):
+    """
+    removes cached dataframes and their warnings whose cache key is not in keys,
+    so data of changed or removed files doesn't stay on disk. other files in the
+    folder are kept.
+
+    :param cache_folder: folder containing the cached dataframes.
+    :param keys: cache keys of the dataframes to keep.
+    """
+    if not os.path.isdir(cache_folder):
+        return
+
+    removed = 0
+    for file_name in os.listdir(cache_folder):
+        match = FRAME_CACHE_FILE.fullmatch(file_name)
+        if match is None or match.group(1) in keys:
+            continue
+        try:
+            os.remove(os.path.join(cache_folder, file_name))
+            removed += 1
+        except OSError as e:
+            logging.warning(f"cache not removed {file_name}: {e}")
+
+    if removed:
+        logging.debug(f"cache pruned: {removed} files")
+
+
+def load_frame(cache_folder: str, key: str) -> pd.DataFrame:
+    """
+    loads a cached dataframe.
+
+    :param cache_folder: folder containing the cached dataframes.
+    :param key: cache key of the dataframe.
+    :return: the cached dataframe, or None if not cached.
+    """
+    cache_path = frame_cache_path(cache_folder, key)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        if cache_path.endswith(".parquet"):
+            df = pd.read_parquet(cache_path)
+            # parquet returns missing strings as None, pipeline expects NaN
+            for col in df.columns[df.dtypes == object]:
+                df[col] = df[col].where(df[col].notna(), np.nan)
+            return df
+        return pd.read_pickle(cache_path)
+    except Exception as e:
+        logging.warning(f"cache ignored {os.path.basename(cache_path)}: {e}")
+        return None
+
+
+def save_frame(df: pd.DataFrame, cache_folder: str, key: str):
+    """
+    saves a dataframe to the cache.
+
+    :param df: dataframe to cache.
+    :param cache_folder: folder containing the cached dataframes.
+    :param key: cache key of the dataframe.
+    """
+    cache_path = frame_cache_path(cache_folder, key)
+
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        if cache_path.endswith(".parquet"):
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+        logging.debug(f"cache saved: {os.path.basename(cache_path)}")
+    except Exception as e:
+        logging.warning(f"cache not saved {os.path.basename(cache_path)}: {e}")
+
+
+def parse_cache_key(file_path: str, info: dict, cache_file: str = None) -> str:
+    """
+    returns the parse cache key of a source file. the key changes when the file
+    content, its name, its .yml config or the normalization code changes.
+
+    :param file_path: path to the source file.
+    :param info: file information from collect_files.
+    :param cache_file: path to the file hash cache file.
+    :return: cache key of the parsed source file.
+    """
+    key = "__".join(
+        [
+            file_hash(file_path, cache_file),
+            info.get("config_hash", ""),
+            info["file_name"],
+            str(PARSE_CACHE_VERSION),
+        ]
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
@@ -1,11 +1,31 @@
 import os
 import logging
-import chardet
 import numpy as np
 import pandas as pd
 import re
 
+from chardet.universaldetector import UniversalDetector
+
 from config.settings import SETTINGS
+from data_pipeline.src.utils.cache import (
+    file_signature,
+    load_json_cache,
+    save_json_cache,
+)
+
+# encoding detection reads files in chunks and stops after this many bytes
+ENCODING_CHUNK_BYTES = 64 * 1024
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+# detected encodings by absolute file path, loaded from the encoding cache file once
+_encoding_cache = None
+# True when _encoding_cache has entries not saved to the encoding cache file yet
+_encoding_cache_changed = False
+
+# number format of source file amounts if not set in the .yml config
+DEFAULT_DECIMAL_SEPARATOR = ","
+DEFAULT_THOUSANDS_SEPARATOR = "\xa0"
+DEFAULT_MINUS_SIGNS = "−"
 
 
 def clean_string(value: str) -> str:
@@ -18,6 +38,23 @@ def clean_string(value: str) -> str:
     return cleaned_value
 
 
+def format_id_value(value) -> str:
+    """
+    formats a value for an ID: missing values as empty and timestamps as yyyymmdd.
+
+    :param value: value to format.
+    :return: the formatted value.
+    """
+    if pd.isna(value):
+        return ""
+    elif isinstance(value, str):
+        return value
+    elif isinstance(value, pd.Timestamp):
+        return value.strftime("%Y%m%d")
+    else:
+        return str(value)
+
+
 def create_id(row: pd.Series) -> str:
     """
     creates a unique ID for a row by concatenating its values into a string,
@@ -26,16 +63,7 @@ def create_id(row: pd.Series) -> str:
     :param row: The row for which to create the ID (expects a dictionary).
     :return: The created ID as a concatenated string.
     """
-    formatted_values = []
-    for key, value in row.items():
-        if pd.isna(value):
-            formatted_values.append("")
-        elif isinstance(value, str):
-            formatted_values.append(value)
-        elif isinstance(value, pd.Timestamp):
-            formatted_values.append(value.strftime("%Y%m%d"))
-        else:
-            formatted_values.append(str(value))
+    formatted_values = [format_id_value(value) for _, value in row.items()]
 
     # concatenate row values into a single string separated by '__'
     row_str = "__".join(formatted_values).lower()
@@ -46,6 +74,76 @@ def create_id(row: pd.Series) -> str:
     return cleaned_row_str
 
 
+def id_parts(values: pd.Series, before: str, after: str) -> np.ndarray:
+    """
+    formats, lowercases and cleans the values of one ID column like create_id.
+    each distinct value is handled once. clean_string looks at the characters next
+    to an underscore, so values are cleaned with the separators around them in the ID.
+
+    :param values: column of the ID.
+    :param before: separator before the value in the ID.
+    :param after: separator after the value in the ID.
+    :return: array of cleaned values.
+    """
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) not in [
+        "string",
+        "empty",
+    ]:
+        # mixed values like 1 and 1.0 are the same distinct value but format differently
+        codes, uniques = np.arange(len(values)), values.to_numpy()
+    else:
+        codes, uniques = pd.factorize(values)
+
+    parts = []
+    for value in uniques:
+        cleaned = clean_string(f"{before}{format_id_value(value).lower()}{after}")
+        parts.append(cleaned[len(before) : len(cleaned) - len(after)])
+    # extra empty value at the end is picked by code -1 of missing values
+    return np.array(parts + [""], dtype=object)[codes]
+
+
+def create_ids(df: pd.DataFrame, columns: list) -> pd.Series:
+    """
+    creates the create_id of every row of the dataframe, column by column.
+
+    :param df: dataframe containing the ID columns.
+    :param columns: columns of the ID in order.
+    :return: series of IDs, identical to create_id of each row.
+    """
+    ids = np.full(len(df), "", dtype=object)
+    for i, column in enumerate(columns):
+        before = "__" if i > 0 else ""
+        after = "__" if i < len(columns) - 1 else ""
+        ids = ids + before + id_parts(df[column], before, after)
+    return pd.Series(ids, index=df.index, dtype=object)
+
+
+def create_id_keys(ids: pd.Series) -> pd.Series:
+    """
+    creates a 64-bit key of each ID for joins and duplicate checks, faster and
+    smaller than the ID strings. the keys are a seeded hash of the ID, so the same
+    ID gets the same key in every run.
+
+    :param ids: series of IDs from create_ids.
+    :return: series of int64 keys.
+    """
+    hashes = pd.util.hash_pandas_object(ids.astype(object), index=False)
+    return pd.Series(hashes.to_numpy().view(np.int64), index=ids.index)
+
+
+def id_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    returns the id_key column of the dataframe, or creates the keys from
+    not_unique_id when the column is missing, e.g. in final_data.csv.
+
+    :param df: dataframe with not_unique_id column.
+    :return: series of int64 keys.
+    """
+    if "id_key" in df.columns:
+        return df["id_key"]
+    return create_id_keys(df["not_unique_id"])
+
+
 def save_on_debug(df, file_path):
     """
     saves the dataframe to a csv file if debugging is enabled.
@@ -63,23 +161,97 @@ def save_on_debug(df, file_path):
             raise
 
 
-def detect_encoding(file_path: str) -> str:
+def sniff_encoding(file_path: str, max_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """
+    detects the encoding of a file by feeding it to chardet in chunks.
+
+    stops as soon as chardet is confident or max_bytes have been read. a file
+    that is pure ascii up to max_bytes is reported as utf-8, which reads the ascii
+    part the same and also a later umlaut the sample didn't reach.
+
+    :param file_path: path to the file.
+    :param max_bytes: maximum number of bytes to sample.
+    :return: detected encoding of the file.
+    """
+    detector = UniversalDetector()
+    sampled = 0
+    truncated = False
+
+    with open(file_path, "rb") as f:
+        while not detector.done:
+            chunk = f.read(min(ENCODING_CHUNK_BYTES, max_bytes - sampled))
+            if not chunk:
+                break
+
+            detector.feed(chunk)
+            sampled += len(chunk)
+            if sampled >= max_bytes:
+                truncated = bool(f.read(1))
+                break
+
+    detector.close()
+    encoding = detector.result["encoding"]
+    if truncated and encoding == "ascii":
+        return "utf-8"
+    return encoding
+
+
+def detect_encoding(
+    file_path: str, use_cache: bool = True, save_cache: bool = True
+) -> str:
     """
     detects the encoding of a file.
 
+    results are cached by path, size and modification time in the encoding cache
+    file, so unchanged files are not sniffed again on later runs.
+
     :param file_path: path to the file.
+    :param use_cache: whether to use the encoding cache.
+    :param save_cache: whether to save a new result to the cache file right away.
+        if False, the caller saves all new results once with save_encoding_cache.
     :return: detected encoding of the file.
     """
+    global _encoding_cache, _encoding_cache_changed
+
     try:
-        with open(file_path, "rb") as f:
-            rawdata = f.read()
-        result = chardet.detect(rawdata)
-        return result["encoding"]
+        cache_file = SETTINGS["encoding_cache_file"] if use_cache else None
+        key = os.path.abspath(file_path)
+        signature = file_signature(file_path)
+
+        if cache_file:
+            if _encoding_cache is None:
+                _encoding_cache = load_json_cache(cache_file)
+
+            cached = _encoding_cache.get(key)
+            if cached and all(cached.get(k) == v for k, v in signature.items()):
+                logging.debug(f"encoding from cache: {os.path.basename(file_path)}")
+                return cached["encoding"]
+
+        encoding = sniff_encoding(file_path)
+
+        if cache_file:
+            _encoding_cache[key] = {**signature, "encoding": encoding}
+            _encoding_cache_changed = True
+            if save_cache:
+                save_encoding_cache()
+
+        return encoding
     except Exception as e:
         logging.error(f"error - detect_encoding {file_path}: {e}")
         raise
 
 
+def save_encoding_cache():
+    """
+    saves the detected encodings to the encoding cache file if there are new ones.
+    """
+    global _encoding_cache_changed
+
+    if _encoding_cache_changed:
+        save_json_cache(SETTINGS["encoding_cache_file"], _encoding_cache)
+        _encoding_cache_changed = False
+
+
 def write_to_csv(data: pd.DataFrame, file_path: str) -> None:
     """
     writes a dataframe to a csv file.
@@ -131,6 +303,80 @@ def parse_date(date_str, formats, dayfirst):
     return pd.NaT
 
 
+def parse_dates(dates: pd.Series, formats: str, dayfirst) -> tuple:
+    """
+    parses a column of date strings, trying each format on the whole column at once.
+
+    each format is applied only to the values that are still unparsed, in the given order.
+
+    :param dates: series of date strings.
+    :param formats: date formats to try, separated by '|'.
+    :param dayfirst: whether to interpret the day as the first part of the date.
+    :return: tuple of parsed dates and a series of the values no format could parse.
+    """
+    parsed = pd.Series(pd.NaT, index=dates.index, dtype="datetime64[ns]")
+    remaining = dates.notna()
+
+    for format in formats.split("|"):
+        if not remaining.any():
+            break
+        converted = pd.to_datetime(
+            dates[remaining], format=format, dayfirst=dayfirst, errors="coerce"
+        )
+        parsed[converted.index] = converted
+        remaining &= parsed.isna()
+
+    return parsed.dt.floor("D"), dates[remaining]
+
+
+def parse_amounts(
+    amounts: pd.Series,
+    decimal_separator: str = None,
+    thousands_separator: str = None,
+    minus_signs: str = None,
+    cents: bool = False,
+) -> pd.Series:
+    """
+    parses a column of amounts written in a source specific number format.
+
+    numeric columns and columns of plain numbers are converted without string processing.
+    other values are cleaned in a single str.translate pass: thousands separators are
+    removed, the decimal separator becomes '.' and each minus sign becomes '-'.
+
+    :param amounts: series of amounts.
+    :param decimal_separator: decimal separator, default ','. '.' is always accepted too
+        unless it's the thousands separator.
+    :param thousands_separator: thousands separator characters, default no-break space.
+    :param minus_signs: characters used as minus sign in addition to '-', default '−'.
+    :param cents: return integer cents instead of float amounts.
+    :return: series of float amounts, or Int64 cents if cents is True.
+    """
+    decimal_separator = decimal_separator or DEFAULT_DECIMAL_SEPARATOR
+    thousands_separator = thousands_separator or DEFAULT_THOUSANDS_SEPARATOR
+    minus_signs = minus_signs or DEFAULT_MINUS_SIGNS
+
+    values = None
+    if pd.api.types.is_numeric_dtype(amounts):
+        values = amounts.astype(float)
+    elif "." not in thousands_separator:
+        # plain numbers like 12.5 don't need cleaning
+        try:
+            values = amounts.astype(float)
+        except (TypeError, ValueError):
+            values = None
+
+    if values is None:
+        table = {ord(char): None for char in thousands_separator}
+        table[ord(decimal_separator)] = "."
+        table.update({ord(char): "-" for char in minus_signs})
+        values = amounts.astype(str).str.translate(table).astype(float)
+
+    if cents:
+        # amounts with at most two decimals are exact after rounding
+        return (values * 100).round().astype("Int64")
+    return values
+
+
 def clean_folder(folder_path: str):
     """
     deletes all files in the specified folder.
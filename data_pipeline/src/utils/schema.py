@@ -0,0 +1,79 @@
+import pandas as pd
+
+# columns with only a few distinct values, stored as pandas categoricals
+CATEGORY_COLUMNS = [
+    "account",
+    "source_file",
+    "row_type",
+    "owner",
+    "class",
+    "category",
+    "sub_category",
+]
+DATE_COLUMNS = ["date"]
+# money stays in float euros: not_unique_id and final_data.csv use the euro values
+MONEY_COLUMNS = ["amount_original", "amount"]
+
+
+def is_categorical(series: pd.Series) -> bool:
+    """
+    checks if a series is categorical.
+
+    :param series: series to check.
+    :return: True if the series has a categorical dtype, False otherwise.
+    """
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    converts the pipeline dataframe columns to their schema types.
+    only existing columns are converted, so this can be called after any stage.
+
+    :param df: dataframe to convert.
+    :return: dataframe with categorical, datetime and float columns.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not is_categorical(df[col]):
+            df[col] = df[col].astype("category")
+
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+
+    for col in MONEY_COLUMNS:
+        if col in df.columns and df[col].dtype != float:
+            df[col] = df[col].astype(float)
+
+    return df
+
+
+def release_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    converts categorical columns back to object columns, for code that writes
+    new values or fills missing values in them.
+
+    :param df: dataframe to convert.
+    :return: dataframe without categorical columns.
+    """
+    for col in df.columns:
+        if is_categorical(df[col]):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def add_categories(df: pd.DataFrame, column: str, values) -> pd.DataFrame:
+    """
+    adds values to the categories of a categorical column so they can be assigned to rows.
+
+    :param df: dataframe containing the column.
+    :param column: name of the column.
+    :param values: values to be assigned to the column.
+    :return: dataframe with the new categories added.
+    """
+    if column in df.columns and is_categorical(df[column]):
+        new_values = pd.Index(pd.Series(values).dropna().unique())
+        new_values = new_values.difference(df[column].cat.categories)
+        if not new_values.empty:
+            df[column] = df[column].cat.add_categories(new_values)
+    return df
@@ -3,3 +3,28 @@ import os
 
 # add the project root directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import pytest
+
+import data_pipeline.src.utils.helpers as helpers
+from config.settings import SETTINGS
+
+# files and folders the pipeline writes to the data folder, by settings key
+DATA_FILE_SETTINGS = {
+    "encoding_cache_file": "cache/encodings.json",
+    "config_registry_cache_file": "cache/config_registry.json",
+    "file_hash_cache_file": "cache/file_hashes.json",
+    "parse_cache_folder": "cache/parsed",
+    "categorization_memo_folder": "cache/categorization",
+    "rule_profile_file": "intermediate/4_rule_profile.csv",
+    "final_result_folder": "final",
+}
+
+
+@pytest.fixture(autouse=True)
+def temporary_data_files(tmp_path, monkeypatch):
+    # tests write caches, profiles and backups to a temporary folder, never to the user's data
+    for key, path in DATA_FILE_SETTINGS.items():
+        monkeypatch.setitem(SETTINGS, key, str(tmp_path / "data" / path))
+    monkeypatch.setattr(helpers, "_encoding_cache", None)
+    monkeypatch.setattr(helpers, "_encoding_cache_changed", False)
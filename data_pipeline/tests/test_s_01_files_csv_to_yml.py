@@ -3,7 +3,11 @@ import os
 import pytest
 import pandas as pd
 
-from data_pipeline.src.source_file_reader.s_01_files_csv_to_yml import csv_to_yml
+import data_pipeline.src.source_file_reader.config_registry as config_registry
+from data_pipeline.src.source_file_reader.s_01_files_csv_to_yml import (
+    csv_to_yml,
+    validate_yml_files,
+)
 
 
 def test_csv_to_yml_valid():
@@ -86,5 +90,59 @@ def test_csv_to_yml_missing_fields():
         csv_to_yml(df, "data_pipeline/tests/data")
 
 
+def test_validate_yml_files_uses_registry(tmpdir, monkeypatch):
+    # use a temporary registry cache file
+    cache_file = str(tmpdir.join("cache", "config_registry.json"))
+    monkeypatch.setitem(
+        config_registry.SETTINGS, "config_registry_cache_file", cache_file
+    )
+
+    yml_directory = tmpdir.mkdir("yml")
+    yml_directory.join("bank.yml").write(
+        "id: 1\npattern: bank\naccount: bank\ndelimiter: ','\n"
+        + "date_format: '%d.%m.%Y'\nday_first: 'TRUE'\n"
+        + "columns: {date: d, amount: a, description: t, info: i}\n"
+    )
+    yml_directory.join("card.yml").write("id: 2\npattern: card\n")
+
+    # test that missing properties are reported
+    with pytest.raises(ValueError, match=r"card.yml has errors:\nmissing properties"):
+        validate_yml_files(str(yml_directory))
+
+    # test that a valid directory is parsed once and matched with the registry
+    os.remove(str(yml_directory.join("card.yml")))
+    validate_yml_files(str(yml_directory))
+    assert os.path.exists(cache_file)
+
+    registry = config_registry.load_config_registry(str(yml_directory))
+    yml_file, config = config_registry.match_config(registry, "bank_2024.csv")
+    assert yml_file == "bank.yml"
+    assert config["account"] == "bank"
+    assert config_registry.match_config(registry, "other.csv") == (None, None)
+
+
+def test_load_config_registry_date_value(tmpdir, monkeypatch):
+    cache_folder = tmpdir.mkdir("cache")
+    cache_file = str(cache_folder.join("config_registry.json"))
+    monkeypatch.setitem(
+        config_registry.SETTINGS, "config_registry_cache_file", cache_file
+    )
+
+    # an unquoted date is loaded as a date, which can't be saved to the json cache
+    yml_directory = tmpdir.mkdir("yml")
+    yml_directory.join("bank.yml").write(
+        "id: 1\npattern: bank\naccount: bank\ndelimiter: ','\n"
+        + "date_format: '%d.%m.%Y'\nday_first: 'TRUE'\nadded: 2024-01-01\n"
+        + "columns: {date: d, amount: a, description: t, info: i}\n"
+    )
+
+    registry = config_registry.load_config_registry(str(yml_directory))
+    yml_file, config = config_registry.match_config(registry, "bank_2024.csv")
+    assert yml_file == "bank.yml"
+    assert str(config["added"]) == "2024-01-01"
+    # no cache file or half written temporary file is left behind
+    assert cache_folder.listdir() == []
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -1,14 +1,21 @@
 import sys
 import os
+import logging
+import datetime
+import openpyxl
 import pytest
 import pandas as pd
 
 
+import data_pipeline.src.utils.helpers as helpers
+from config.settings import SETTINGS
 from data_pipeline.src.utils.helpers import detect_encoding
 from data_pipeline.src.source_file_reader.s_02_reader import (
     read_csv_file,
     read_excel_file,
     read_yaml_file,
+    read_collected_files,
+    collect_files,
 )
 
 
@@ -22,16 +29,105 @@ def test_read_csv_file():
         read_csv_file("./data/non_existent.csv")
 
 
+def test_read_csv_file_engines(tmpdir, caplog):
+    caplog.set_level(logging.INFO)
+
+    # test that an escaped tab delimiter from .yml is read with the c engine
+    tab_file = str(tmpdir.join("tab.csv"))
+    with open(tab_file, "w", encoding="utf-8") as f:
+        f.write("date\tamount\n2023-01-01\t1,5\n")
+    df = read_csv_file(tab_file, encoding="utf-8", delimiter="\\t")
+    assert list(df.columns) == ["date", "amount"]
+    assert df.loc[0, "amount"] == "1,5"
+    assert "read csv: tab.csv (utf-8, c)" in caplog.text
+
+    # test that a regex delimiter falls back to the python engine
+    regex_file = str(tmpdir.join("regex.csv"))
+    with open(regex_file, "w", encoding="utf-8") as f:
+        f.write("date;;amount\n2023-01-01;;1,5\n")
+    df = read_csv_file(regex_file, encoding="utf-8", delimiter=";;")
+    assert list(df.columns) == ["date", "amount"]
+    assert "read csv: regex.csv (utf-8, python)" in caplog.text
+
+
+def test_read_csv_file_engines_match(tmpdir, monkeypatch):
+    # empty cells, an unnamed column and duplicate columns are read the same by both engines
+    file_path = str(tmpdir.join("engines.csv"))
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("date;amount;currency;info;currency;\n2023-01-01;1,5;EUR;;EUR;\n")
+
+    monkeypatch.setitem(SETTINGS, "csv_engine", "c")
+    df_c = read_csv_file(file_path, encoding="utf-8", delimiter=";")
+    monkeypatch.setitem(SETTINGS, "csv_engine", "python")
+    df_python = read_csv_file(file_path, encoding="utf-8", delimiter=";")
+
+    pd.testing.assert_frame_equal(df_c, df_python)
+    assert list(df_c.columns)[-2:] == ["currency.1", "Unnamed: 5"]
+    assert pd.isna(df_c.loc[0, "info"])
+
+    # test that pyarrow is not accepted
+    monkeypatch.setitem(SETTINGS, "csv_engine", "pyarrow")
+    with pytest.raises(ValueError):
+        read_csv_file(file_path, encoding="utf-8", delimiter=";")
+
+
 def test_read_excel_file():
     # test reading a valid Excel file
     df = read_excel_file("data_pipeline/tests/data/valid.xlsx")
     assert not df.empty
 
+    # test that the streamed data is the same as with pandas
+    pd.testing.assert_frame_equal(
+        df, pd.read_excel("data_pipeline/tests/data/valid.xlsx", dtype=str)
+    )
+
     # test reading a non-existent Excel file
     with pytest.raises(Exception):
         read_excel_file("./data/non_existent.xlsx")
 
 
+def test_read_excel_file_sheet_and_header_row(tmpdir):
+    # create a workbook with the data on the second sheet below a title row
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["not used"])
+    sheet = workbook.create_sheet("transactions")
+    sheet.append(["Export 2024"])
+    sheet.append(["Date", "Amount", "Text"])
+    sheet.append([datetime.datetime(2024, 1, 31), 1.0, "Shop"])
+    sheet.append([datetime.datetime(2024, 2, 1), -2.5, None])
+    file_path = str(tmpdir.join("sheets.xlsx"))
+    workbook.save(file_path)
+
+    df = read_excel_file(file_path, sheet="transactions", header_row=2)
+    assert list(df.columns) == ["Date", "Amount", "Text"]
+    assert df.loc[0, "Date"] == "2024-01-31 00:00:00"
+    assert df.loc[0, "Amount"] == "1"
+    assert df.loc[1, "Amount"] == "-2.5"
+    assert pd.isna(df.loc[1, "Text"])
+
+
+def test_read_excel_file_duplicate_header(tmpdir):
+    # create a workbook with duplicate, numeric and empty header cells
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Amount", "Currency", "Amount", "Currency", 2024, None, "Currency"])
+    sheet.append([1.0, "EUR", 2.5, "EUR", "x", "NA", None])
+    file_path = str(tmpdir.join("duplicates.xlsx"))
+    workbook.save(file_path)
+
+    df = read_excel_file(file_path)
+    assert list(df.columns) == [
+        "Amount",
+        "Currency",
+        "Amount.1",
+        "Currency.1",
+        2024,
+        "Unnamed: 5",
+        "Currency.2",
+    ]
+    pd.testing.assert_frame_equal(df, pd.read_excel(file_path, dtype=str))
+
+
 def test_read_yaml_file():
     # create a temporary YAML file with valid data
     yaml_file = "data_pipeline/tests/data/valid.yml"
@@ -71,5 +167,95 @@ def test_read_yaml_file():
     os.remove(yaml_file)
 
 
+def test_detect_encoding(tmpdir, monkeypatch):
+    # create a file with a long ascii prefix and non-ascii content at the end
+    file_path = str(tmpdir.join("late_umlauts.csv"))
+    with open(file_path, "wb") as f:
+        f.write(b"date,description\n" * 200000)
+        f.write("2023-01-01,Kirjauspäivä Hyvä Pääoma\n".encode("utf-8") * 100)
+
+    # use a temporary cache file
+    cache_file = str(tmpdir.join("cache", "encodings.json"))
+    monkeypatch.setitem(helpers.SETTINGS, "encoding_cache_file", cache_file)
+    monkeypatch.setattr(helpers, "_encoding_cache", None)
+
+    assert detect_encoding(file_path) == "utf-8"
+    assert os.path.exists(cache_file)
+
+    # test that cached result is used while the file is unchanged
+    monkeypatch.setattr(helpers, "sniff_encoding", lambda *args: "not used")
+    assert detect_encoding(file_path) == "utf-8"
+
+
+def test_sniff_encoding_sample(tmpdir):
+    # test that a pure ascii file is sniffed only up to the sample size
+    file_path = str(tmpdir.join("ascii.csv"))
+    with open(file_path, "wb") as f:
+        f.write(b"date,description\n" * 1000)
+    assert helpers.sniff_encoding(file_path, max_bytes=100) == "utf-8"
+    assert helpers.sniff_encoding(file_path) == "ascii"
+
+
+def test_collect_files_saves_encodings_once(tmpdir, monkeypatch):
+    input_folder = tmpdir.mkdir("input")
+    for i in range(3):
+        input_folder.join(f"bank_{i}.csv").write("date,amount,text,info\n")
+    yml_folder = tmpdir.mkdir("yml")
+    yml_folder.join("bank.yml").write("""
+id: bank
+pattern: bank_
+account: bank
+delimiter: ","
+date_format: "%Y-%m-%d"
+day_first: false
+columns:
+  date: date
+  amount: amount
+  description: text
+  info: info
+""")
+
+    monkeypatch.setitem(
+        helpers.SETTINGS, "encoding_cache_file", str(tmpdir.join("encodings.json"))
+    )
+    monkeypatch.setattr(helpers, "_encoding_cache", None)
+    saves = []
+    monkeypatch.setattr(helpers, "save_json_cache", lambda *args: saves.append(args))
+
+    file_info = collect_files(str(input_folder), str(yml_folder))
+    assert len(file_info) == 3
+    assert len(saves) == 1
+    assert len(saves[0][1]) == 3
+
+
+def test_read_collected_files_parallel():
+    csv_info = {
+        "file_name": "valid.csv",
+        "encoding": None,
+        "delimiter": ",",
+    }
+    file_info = {
+        "data_pipeline/tests/data/valid.xlsx": {"file_name": "valid.xlsx"},
+        "data_pipeline/tests/data/valid.csv": csv_info,
+    }
+
+    # test that parallel reading gives the same result in the same order
+    serial = read_collected_files(file_info, workers=1)
+    parallel = read_collected_files(file_info, workers=2)
+    assert list(parallel.keys()) == list(file_info.keys())
+    for file_path in file_info:
+        pd.testing.assert_frame_equal(
+            parallel[file_path]["dataframe"], serial[file_path]["dataframe"]
+        )
+
+    # test that a failing file is reported by name
+    file_info["data_pipeline/tests/data/non_existent.csv"] = {
+        **csv_info,
+        "file_name": "non_existent.csv",
+    }
+    with pytest.raises(ValueError, match="1 files failed to read: non_existent.csv"):
+        read_collected_files(file_info, workers=2)
+
+
 if __name__ == "__main__":
     pytest.main()
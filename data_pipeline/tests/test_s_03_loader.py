@@ -1,10 +1,19 @@
 import sys
 import os
 import pytest
+import numpy as np
 import pandas as pd
 
+import data_pipeline.src.utils.cache as cache
+from config.settings import SETTINGS
 from data_pipeline.src.data_processing.s_03_loader import append_dataframes
-from data_pipeline.src.utils.helpers import create_id, parse_date
+from data_pipeline.src.source_file_reader.s_02_reader import read_collected_files
+from data_pipeline.src.utils.helpers import (
+    create_id,
+    parse_date,
+    parse_dates,
+    parse_amounts,
+)
 
 
 def test_append_dataframes_valid():
@@ -72,6 +81,13 @@ def test_append_dataframes_valid():
     assert "row_type" in df_all.columns
     assert "source_file" in df_all.columns
 
+    # check that the columns have the pipeline schema types
+    assert isinstance(df_all["account"].dtype, pd.CategoricalDtype)
+    assert isinstance(df_all["source_file"].dtype, pd.CategoricalDtype)
+    assert isinstance(df_all["row_type"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_dtype(df_all["date"])
+    assert df_all["amount"].dtype == float
+
 
 def test_append_dataframes_missing_columns():
     # create a temporary DataFrame with missing columns
@@ -105,5 +121,160 @@ def test_append_dataframes_missing_columns():
         append_dataframes(dataframes)
 
 
+def test_parse_dates():
+    dates = pd.Series(
+        ["2023-03-31 22:28:15.838000", "2023-03-30 23:00:00", "31.3.2023", np.nan]
+    )
+    formats = "%Y-%m-%d %H:%M:%S.%f|%Y-%m-%d %H:%M:%S"
+
+    parsed, unparsed = parse_dates(dates, formats, dayfirst=False)
+
+    # test that the column is parsed like parse_date parses single values
+    for i in range(len(dates)):
+        expected = parse_date(dates[i], formats, dayfirst=False)
+        assert (pd.isna(parsed[i]) and pd.isna(expected)) or parsed[i] == expected
+    assert parsed[0] == pd.Timestamp("2023-03-31")
+
+    # test that only values no format could parse are reported
+    assert unparsed.to_dict() == {2: "31.3.2023"}
+
+
+def test_parse_amounts():
+    # test the default format, same as before number formats could be configured
+    amounts = pd.Series(["-11,65", "8\xa0552,46", "−3.5", "+0,36", np.nan])
+    parsed = parse_amounts(amounts)
+    assert parsed[:4].tolist() == [-11.65, 8552.46, -3.5, 0.36]
+    assert pd.isna(parsed[4])
+
+    # test a source specific format and integer cents
+    amounts = pd.Series(["1.234,56", "–7,05", "0,10"])
+    cents = parse_amounts(
+        amounts,
+        decimal_separator=",",
+        thousands_separator=".",
+        minus_signs="–",
+        cents=True,
+    )
+    assert cents.tolist() == [123456, -705, 10]
+
+    # test that numeric columns are used as is
+    assert parse_amounts(pd.Series([100.0, -2.5])).tolist() == [100.0, -2.5]
+
+
+def test_append_dataframes_parse_cache(tmpdir, monkeypatch):
+    # use a temporary parse cache
+    monkeypatch.setitem(SETTINGS, "parse_cache_folder", str(tmpdir.join("parsed")))
+    monkeypatch.setitem(SETTINGS, "file_hash_cache_file", None)
+
+    file_path = str(tmpdir.join("bank.csv"))
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(
+            "Date;Amount;Text;Info\n01.02.2023;-1,5;Shop;\n02.02.2023;10;Salary;x\n"
+        )
+
+    file_info = {
+        file_path: {
+            "file_name": "bank.csv",
+            "account": "bank",
+            "encoding": "utf-8",
+            "delimiter": ";",
+            "date_format": "%d.%m.%Y",
+            "day_first": True,
+            "columns": {
+                "date": "Date",
+                "amount": "Amount",
+                "description": "Text",
+                "info": "Info",
+            },
+            "config_hash": "config1",
+        }
+    }
+
+    # first run parses the file and stores it to the cache
+    dataframes = read_collected_files(file_info, workers=1, use_cache=True)
+    assert not dataframes[file_path].get("normalized")
+    df_parsed = append_dataframes(dataframes)
+
+    # second run loads the normalized file from the cache
+    dataframes = read_collected_files(file_info, workers=1, use_cache=True)
+    assert dataframes[file_path]["normalized"]
+    df_cached = append_dataframes(dataframes)
+    pd.testing.assert_frame_equal(df_cached, df_parsed)
+
+    # a changed config invalidates the cache
+    file_info[file_path]["config_hash"] = "config2"
+    dataframes = read_collected_files(file_info, workers=1, use_cache=True)
+    assert not dataframes[file_path].get("normalized")
+
+
+def test_append_dataframes_parse_cache_warnings_and_prune(tmpdir, monkeypatch, caplog):
+    parse_cache_folder = tmpdir.join("parsed")
+    monkeypatch.setitem(SETTINGS, "parse_cache_folder", str(parse_cache_folder))
+
+    file_path = str(tmpdir.join("bank.csv"))
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("Date;Amount;Text;Info\n01.02.2023;-1,5;Shop;\n40.02.2023;10;x;\n")
+
+    file_info = {
+        file_path: {
+            "file_name": "bank.csv",
+            "account": "bank",
+            "encoding": "utf-8",
+            "delimiter": ";",
+            "date_format": "%d.%m.%Y",
+            "day_first": True,
+            "columns": {
+                "date": "Date",
+                "amount": "Amount",
+                "description": "Text",
+                "info": "Info",
+            },
+            "config_hash": "config1",
+        }
+    }
+    append_dataframes(read_collected_files(file_info, workers=1, use_cache=True))
+    old_files = parse_cache_folder.listdir()
+    parse_cache_folder.join("notes.txt").write("keep")
+
+    # the warning of the unparsed date is logged also when the file comes from the cache
+    caplog.clear()
+    dataframes = read_collected_files(file_info, workers=1, use_cache=True)
+    assert dataframes[file_path]["normalized"]
+    append_dataframes(dataframes)
+    assert "dates not parsed: 1 rows in bank.csv" in caplog.text
+
+    # a changed config caches the file again and the old cached file is removed
+    file_info[file_path]["config_hash"] = "config2"
+    append_dataframes(read_collected_files(file_info, workers=1, use_cache=True))
+    read_collected_files(file_info, workers=1, use_cache=True)
+    files = parse_cache_folder.listdir()
+    assert not any(old_file in files for old_file in old_files)
+    assert parse_cache_folder.join("notes.txt") in files
+    assert len(files) == 3
+
+
+def test_read_collected_files_saves_hashes_once(tmpdir, monkeypatch):
+    monkeypatch.setitem(SETTINGS, "parse_cache_folder", str(tmpdir.join("parsed")))
+    hash_cache_file = str(tmpdir.join("file_hashes.json"))
+    monkeypatch.setitem(SETTINGS, "file_hash_cache_file", hash_cache_file)
+    saves = []
+    monkeypatch.setattr(cache, "save_json_cache", lambda *args: saves.append(args))
+
+    file_info = {}
+    for i in range(3):
+        file_path = str(tmpdir.join(f"bank_{i}.csv"))
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f"Date;Amount\n01.02.2023;{i}\n")
+        file_info[file_path] = {
+            "file_name": f"bank_{i}.csv",
+            "encoding": "utf-8",
+            "delimiter": ";",
+        }
+
+    read_collected_files(file_info, workers=1, use_cache=True)
+    assert [args[0] for args in saves] == [hash_cache_file]
+    assert len(saves[0][1]) == 3
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -3,7 +3,401 @@ import os
 
 import pytest
 import pandas as pd
-from data_pipeline.src.data_processing.s_04_categorizer import categorize_data
+from config.settings import SETTINGS
+from data_pipeline.src.data_processing.s_04_categorizer import (
+    apply_categorization,
+    categorize_data,
+    load_categorization_rules,
+    validate_categories,
+)
+from data_pipeline.src.data_processing import rule_engine
+from data_pipeline.src.data_processing.rule_engine import (
+    account_buckets,
+    categorization_keys,
+    column_index,
+    compile_pattern,
+    compile_rules,
+    context_row_keys,
+    evaluate_rules,
+    evaluate_rules_parallel,
+    find_memo,
+    load_memo,
+    pattern_mask,
+    regex_risks,
+    rules_diff,
+    rules_fingerprint,
+    save_memo,
+)
+
+RULES_FILE = os.path.join(os.path.dirname(__file__), "data", "categories.csv")
+
+
+def rows_to_categorize():
+    # rows hitting several rules, regex rules, account rules and zero and missing amounts
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2023-12-01"] * 8),
+            "account": ["s-pankki", "varat", "nordea", "nordnet_salkkuraportti"]
+            + ["osingot", "luottokortti", "s-pankki", "nordea"],
+            "description": ["Prisma Netflix", "S-P", "Asunto", "Salkku"]
+            + ["x", None, "Oma tilisiirto / muuta", "ASUNTO"],
+            "info": ["", "", "", "Salkku 3", "", "HYVITYSKORKO", "", ""],
+            "amount": [-10.0, 5.0, 0.0, 100.0, 1.0, 2.0, -3.0, float("nan")],
+            "source_file": ["file.csv"] * 8,
+            "row_type": ["Actual"] * 8,
+        }
+    )
+
+
+def test_apply_categorization_engines_match():
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+
+    loop_df = apply_categorization(rows_to_categorize(), rules_df, engine="loop")
+    compiled_df = apply_categorization(
+        rows_to_categorize(), rules_df, engine="compiled"
+    )
+
+    pd.testing.assert_frame_equal(loop_df, compiled_df)
+    # last matching rule wins
+    assert list(compiled_df["rule_id"].iloc[:7]) == [
+        "4",
+        "6",
+        "0",
+        "11",
+        "15",
+        "5",
+        "24",
+    ]
+    assert pd.isna(compiled_df["rule_id"].iloc[7])
+
+
+def test_categorization_keys():
+    df = pd.DataFrame(
+        {
+            "account": ["a", "a", "a", "b", "a", "a"],
+            "description": ["x", "x", "x", "x", None, None],
+            "info": ["", "", "", "", "", ""],
+            "amount": [-1.0, -2.5, 3.0, -1.0, 0.0, 0.0],
+        }
+    )
+
+    keys, row_keys = categorization_keys(df)
+
+    assert len(keys) == 4
+    assert list(row_keys) == [0, 0, 1, 2, 3, 3]
+    assert list(keys["sign"]) == [-1.0, 1.0, -1.0, 0.0]
+    assert pd.isna(keys.loc[3, "description"])
+
+
+def test_apply_categorization_memo(tmpdir, monkeypatch):
+    # use a temporary memo folder
+    memo_folder = str(tmpdir.join("categorization"))
+    monkeypatch.setitem(SETTINGS, "categorization_memo_folder", memo_folder)
+    monkeypatch.setitem(SETTINGS, "use_categorization_memo", True)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    fingerprint = rules_fingerprint(rules_df)
+
+    expected_df = apply_categorization(rows_to_categorize(), rules_df, engine="loop")
+
+    # first run evaluates all keys and saves them to the memo
+    df = rows_to_categorize().iloc[:6]
+    first_df = apply_categorization(df, rules_df, engine="compiled")
+    pd.testing.assert_frame_equal(
+        first_df, expected_df.iloc[:6], check_categorical=False
+    )
+    assert len(load_memo(memo_folder, fingerprint)) == 6
+
+    # next run reads the known keys from the memo and adds the new ones
+    second_df = apply_categorization(rows_to_categorize(), rules_df, engine="compiled")
+    pd.testing.assert_frame_equal(second_df, expected_df)
+    memo = load_memo(memo_folder, fingerprint)
+    assert len(memo) == 8
+
+    # results come from the memo, not from evaluating the rules again
+    memo["winner"] = 3
+    save_memo(memo, memo_folder, fingerprint, rules_df)
+    memo_df = apply_categorization(rows_to_categorize(), rules_df, engine="compiled")
+    assert (memo_df["rule_id"] == "3").all()
+
+    # edited rules get a new memo and the old one is removed, other files are kept
+    other_files = [
+        os.path.join(memo_folder, name) for name in ["my_notes.txt", "memo_x"]
+    ]
+    for file_path in other_files:
+        with open(file_path, "w") as f:
+            f.write("keep")
+    rules_df.loc[0, "class"] = "menot"
+    apply_categorization(rows_to_categorize(), rules_df, engine="compiled")
+    assert load_memo(memo_folder, fingerprint) is None
+    assert len(load_memo(memo_folder, rules_fingerprint(rules_df))) == 8
+    assert all(os.path.exists(file_path) for file_path in other_files)
+
+
+def test_rules_diff():
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+
+    # rule 3 removed, new rules in the middle and at the end
+    new_rules_df = pd.concat(
+        [
+            rules_df.iloc[:3],
+            rules_df.iloc[4:10],
+            rules_df.iloc[[0]].assign(id="26", description="new"),
+            rules_df.iloc[10:],
+            rules_df.iloc[[0]].assign(id="27"),
+        ]
+    ).reset_index(drop=True)
+    diff = rules_diff(rules_df, new_rules_df)
+
+    assert diff["added"] == [9, 26]
+    assert list(diff["positions"][:5]) == [0, 1, 2, -1, 3]
+    assert diff["positions"][10] == 10
+
+    # rules in a different order can't be compared
+    assert rules_diff(rules_df, rules_df.iloc[::-1]) is None
+
+
+def test_apply_categorization_rule_changes(tmpdir, monkeypatch):
+    memo_folder = str(tmpdir.join("categorization"))
+    monkeypatch.setitem(SETTINGS, "categorization_memo_folder", memo_folder)
+    monkeypatch.setitem(SETTINGS, "use_categorization_memo", False)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    apply_categorization(rows_to_categorize(), rules_df, engine="compiled")
+
+    # like editing categories.csv in categorize_data_loop: remove the rule of the
+    # first row, change a rule and add a rule for the uncategorized row
+    new_rules_df = rules_df[rules_df["id"] != "4"].copy()
+    new_rules_df.loc[new_rules_df["id"] == "24", "class"] = "tulot"
+    new_rules_df = pd.concat(
+        [
+            new_rules_df,
+            rules_df.iloc[[2]].assign(id="26", description="^ASUNTO$", amount=".*"),
+        ]
+    ).reset_index(drop=True)
+
+    expected_df = apply_categorization(
+        rows_to_categorize(), new_rules_df, engine="loop"
+    )
+    memo_before = find_memo(memo_folder, new_rules_df, compile_rules(new_rules_df))
+    assert memo_before[1]
+
+    updated_df = apply_categorization(
+        rows_to_categorize(), new_rules_df, engine="compiled"
+    )
+    pd.testing.assert_frame_equal(updated_df, expected_df)
+    assert list(updated_df["rule_id"].iloc[[0, 6, 7]]) == ["3", "24", "26"]
+    assert updated_df["class"].iloc[6] == "tulot"
+
+    # nothing is saved when the memo is disabled
+    assert not os.path.exists(memo_folder)
+
+
+def test_compile_pattern():
+    assert compile_pattern("S-Market")["kind"] == "literal"
+    assert compile_pattern("^Prisma")["kind"] == "anchored"
+    assert compile_pattern("Oy$")["kind"] == "anchored"
+    assert compile_pattern("Prisma.*Oy")["kind"] == "regex"
+    # characters str.lower() doesn't fold like the regex engine
+    assert compile_pattern("ſpotify")["kind"] == "regex"
+
+    values = pd.Series(
+        ["S-MARKET Oy", "s-market", "Osuuskauppa S-Market", "Prisma Oy\n"]
+        + ["Lidl – S-Market", "S-KMARKET", "", None, float("nan")],
+        dtype=object,
+    )
+    for pattern in ["s-market", "^s-market", "oy$", "^s-market$", "k", "^$"]:
+        expected = values.str.contains(pattern, case=False, na=False, regex=True)
+        mask = pattern_mask(compile_pattern(pattern), column_index(values))
+        assert list(mask) == list(expected.astype(bool)), pattern
+
+
+def test_evaluate_rules_account_buckets():
+    rules_df = pd.DataFrame(
+        {
+            "id": ["0", "1", "2", "3"],
+            "account": ["nordea", ".*", "nordea", "s-pankki|nordea"],
+            "description": ["prisma", "prisma", ".*", "^lidl"],
+            "info": [".*"] * 4,
+            "amount": [".*", ".*", "neg", ".*"],
+            "class": ["a", "b", "c", "d"],
+            "category": ["a", "b", "c", "d"],
+            "sub_category": [None] * 4,
+        }
+    )
+    rules = compile_rules(rules_df)
+
+    wildcard, buckets = account_buckets(rules)
+    assert [rule["id"] for rule in wildcard] == ["1"]
+    assert {
+        pattern: [rule["id"] for rule in bucket] for pattern, bucket in buckets.items()
+    } == {"nordea": ["0", "2"], "s-pankki|nordea": ["3"]}
+
+    keys = pd.DataFrame(
+        {
+            "account": ["nordea", "nordea", "s-pankki", None, "nordea"],
+            "description": ["Prisma", "Prisma", "Lidl", "Prisma", "Lidl Oy"],
+            "info": [""] * 5,
+            "sign": [1.0, -1.0, -1.0, -1.0, 1.0],
+        }
+    )
+    # buckets and wildcard rules are merged in rule order
+    assert list(evaluate_rules(keys, rules)) == [1, 2, 3, 1, 3]
+
+
+def test_evaluate_rules_parallel(monkeypatch):
+    monkeypatch.setattr(rule_engine, "MIN_SHARD_ROWS", 2)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    rules = compile_rules(rules_df)
+    keys, _ = categorization_keys(rows_to_categorize())
+
+    winners = evaluate_rules_parallel(keys, rules, workers=3)
+
+    assert list(winners) == list(evaluate_rules(keys, rules))
+
+
+def test_apply_categorization_profile(tmpdir, monkeypatch):
+    profile_file = str(tmpdir.join("4_rule_profile.csv"))
+    monkeypatch.setitem(SETTINGS, "rule_profile_file", profile_file)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+
+    profiled_df = apply_categorization(rows_to_categorize(), rules_df, engine="profile")
+    expected_df = apply_categorization(rows_to_categorize(), rules_df, engine="loop")
+    pd.testing.assert_frame_equal(profiled_df, expected_df)
+
+    report = pd.read_csv(profile_file, dtype={"rule_id": str}).set_index("rule_id")
+    assert len(report) == len(rules_df)
+    assert list(report["time_ms"]) == sorted(report["time_ms"], reverse=True)
+    # Netflix and muuta match but later rules win their rows
+    assert report.loc["3", "status"] == "shadowed"
+    assert report.loc["14", "rows_matched"] == 1
+    assert report.loc["14", "status"] == "shadowed"
+    assert report.loc["24", "rows_won"] == 1
+    assert report.loc["24", "status"] == "ok"
+    assert report.loc["25", "status"] == "dead"
+
+
+def test_regex_risks():
+    assert regex_risks("(a+)+") == ["nested quantifier"]
+    assert regex_risks("(\\w+\\s?)*$") == ["nested quantifier"]
+    assert regex_risks(".*a.*b.*c") == ["more than 2 unbounded wildcards"]
+    for pattern in ["Prisma", "(a|b)+", "^S-Market.*Oy$", "[(a+)]+", "\\(a+\\)+"]:
+        assert regex_risks(pattern) == [], pattern
+
+
+def test_validate_categories():
+    rules_df = pd.DataFrame(
+        {
+            "id": ["1", "2"],
+            "account": ["", "nordea"],
+            "description": [None, "*"],
+            "info": ["*", "S-Market"],
+            "amount": ["pos", float("nan")],
+            "class": ["menot", None],
+            "category": ["ruoka", ""],
+            "sub_category": [None, "*"],
+        }
+    )
+
+    validated_df = validate_categories(rules_df)
+
+    assert list(validated_df["account"]) == [".*", "nordea"]
+    assert list(validated_df["description"]) == [".*", ".*"]
+    assert list(validated_df["info"]) == [".*", "S-Market"]
+    assert list(validated_df["amount"]) == ["pos", ".*"]
+    # result columns are not patterns
+    assert list(validated_df["category"]) == ["ruoka", ""]
+    assert list(validated_df["sub_category"]) == [None, "*"]
+
+
+def test_validate_categories_risky_pattern(caplog):
+    rules_df = load_categorization_rules(RULES_FILE)
+    rules_df.loc[3, "description"] = "(net+)+flix"
+
+    validate_categories(rules_df)
+
+    assert "rule id: 3, description '(net+)+flix': nested quantifier" in caplog.text
+
+
+def test_evaluate_rules_time_budget(caplog, monkeypatch):
+    # without SIGALRM slow rules are reported after the evaluation
+    monkeypatch.setattr(rule_engine, "alarm_available", lambda: False)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    keys, _ = categorization_keys(rows_to_categorize())
+
+    evaluate_rules(keys, compile_rules(rules_df), time_budget=0)
+
+    assert "time budget" in caplog.text
+    assert "rule ids: 0 (" in caplog.text
+
+
+@pytest.mark.skipif(
+    not rule_engine.alarm_available(), reason="needs SIGALRM in the main thread"
+)
+def test_evaluate_rules_time_budget_stops_rule(caplog):
+    rules_df = load_categorization_rules(RULES_FILE)
+    rules_df.loc[3, "description"] = "(a+)+$"
+    rules_df = validate_categories(rules_df)
+    rows = rows_to_categorize()
+    rows.loc[0, "description"] = "a" * 40 + "b"
+    keys, _ = categorization_keys(rows)
+
+    with pytest.raises(TimeoutError, match="rule id: 3 stopped"):
+        evaluate_rules(keys, compile_rules(rules_df), time_budget=0.2)
+
+    assert "rule id: 3 stopped after the 0.2s time budget" in caplog.text
+
+
+def test_evaluate_rules_reverse_order():
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    keys, _ = categorization_keys(rows_to_categorize())
+    rules = compile_rules(rules_df)
+
+    forward = evaluate_rules(keys, rules, reverse=False)
+    assert list(evaluate_rules(keys, rules, reverse=True)) == list(forward)
+
+    # a last rule matching every row wins them all, earlier rules are not evaluated
+    catch_all = rules_df.iloc[[0]].assign(id="26", amount=".*")
+    rules = compile_rules(pd.concat([rules_df, catch_all]).reset_index(drop=True))
+    profile = {}
+    winners = evaluate_rules(keys, rules, profile=profile, reverse=True)
+    assert list(winners) == [26] * len(keys)
+    assert list(profile) == [26]
+
+
+def test_apply_categorization_context(tmpdir, monkeypatch):
+    monkeypatch.setitem(SETTINGS, "categorization_memo_folder", str(tmpdir))
+    monkeypatch.setitem(SETTINGS, "use_categorization_memo", False)
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+    df = rows_to_categorize()
+
+    context = {}
+    apply_categorization(df.copy(), rules_df, engine="compiled", context=context)
+    keys = context["keys"]
+
+    # same rows in another order and changed rules reuse the context
+    shuffled_df = df.iloc[::-1]
+    new_rules_df = rules_df[rules_df["id"] != "4"].reset_index(drop=True)
+    context_df = apply_categorization(
+        shuffled_df.copy(), new_rules_df, engine="compiled", context=context
+    )
+    assert context["keys"] is keys
+    pd.testing.assert_frame_equal(
+        context_df,
+        apply_categorization(shuffled_df.copy(), new_rules_df, engine="loop"),
+    )
+
+    # other rows get a new context
+    assert context_row_keys(context, df.iloc[:5]) is None
+    apply_categorization(
+        df.iloc[:5].copy(), rules_df, engine="compiled", context=context
+    )
+    assert context["keys"] is not keys
+
+
+def test_apply_categorization_unknown_engine():
+    rules_df = validate_categories(load_categorization_rules(RULES_FILE))
+
+    with pytest.raises(ValueError):
+        apply_categorization(rows_to_categorize(), rules_df, engine="unknown")
 
 
 def test_categorize_data():
@@ -100,5 +100,81 @@ def test_split_data():
     assert split_df.loc[2, "split"] == True
 
 
+def test_split_data_periods():
+    df = pd.DataFrame(
+        {
+            "date": ["2023-01-15", "2023-03-01", "2023-06-30", "2023-07-01"]
+            + ["2023-03-01", None],
+            "account": ["op-yhteinen"] * 4 + ["nordea", "op-yhteinen"],
+            "description": ["a", "b", "c", "d", "e", "f"],
+            "info": [""] * 6,
+            "amount": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+            "row_type": ["Actual"] * 6,
+        }
+    )
+    splits_df = pd.DataFrame(
+        {
+            "start": pd.to_datetime(["2023-07-01", "2023-01-01", "2023-01-01"]),
+            "end": pd.to_datetime(["2023-12-31", "2023-06-30", "2023-06-30"]),
+            "account": ["op-yhteinen"] * 3,
+            "share": [0.25, 0.5, 0.5],
+            "owner": ["mkk", "mkk", "mrs. mkk"],
+        }
+    )
+
+    split_df = split_data(df, splits_df)
+
+    # unsplit rows first, then the rows of each split in splits order
+    assert list(split_df["description"]) == [
+        "e",
+        "f",
+        "d",
+        "a",
+        "b",
+        "c",
+        "a",
+        "b",
+        "c",
+    ]
+    assert list(split_df["owner"]) == ["mkk"] * 6 + ["mrs. mkk"] * 3
+    assert list(split_df["amount"]) == [
+        50.0,
+        60.0,
+        10.0,
+        5.0,
+        10.0,
+        15.0,
+        5.0,
+        10.0,
+        15.0,
+    ]
+    assert list(split_df["split"]) == [False, False] + [True] * 7
+
+
+def test_split_data_overlapping_periods():
+    df = pd.DataFrame(
+        {
+            "date": ["2023-03-01"],
+            "account": ["op-yhteinen"],
+            "description": ["a"],
+            "info": [""],
+            "amount": [10.0],
+            "row_type": ["Actual"],
+        }
+    )
+    splits_df = pd.DataFrame(
+        {
+            "start": pd.to_datetime(["2023-01-01", "2023-06-30"]),
+            "end": pd.to_datetime(["2023-06-30", "2023-12-31"]),
+            "account": ["op-yhteinen", "op-yhteinen"],
+            "share": [0.5, 0.5],
+            "owner": ["mkk", "mrs. mkk"],
+        }
+    )
+
+    with pytest.raises(ValueError, match="overlapping split periods"):
+        split_data(df, splits_df)
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -1,7 +1,7 @@
 import pytest
 import pandas as pd
 
-from data_pipeline.src.utils.helpers import clean_string
+from data_pipeline.src.utils.helpers import clean_string, create_id, create_id_keys
 from data_pipeline.src.data_processing.s_06_add_id import add_not_unique_id
 
 
@@ -35,5 +35,52 @@ def test_add_not_unique_id():
         assert row["not_unique_id"] == expected_id
 
 
+def test_add_not_unique_id_matches_create_id():
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2023-01-01", None, "2023-01-03"]),
+            "account": pd.Categorical(["op_", None, "_op"]),
+            "description": ["S-Market Oy", "ΟΔΟΣ", "a_b__c"],
+            "info": [None, "", "viite: 123"],
+            "amount_original": [-0.0, 12.5, float("nan")],
+            "row_type": ["Actual", "Actual", "Target"],
+            "source_file": ["file_1.csv", "file_1.csv", "_file.csv"],
+            "owner": ["mkk", "mrs. mkk", "owner_"],
+        }
+    )
+    expected = [
+        create_id(pd.Series({col: row[col] for col in df.columns}))
+        for _, row in df.iterrows()
+    ]
+
+    df_with_id = add_not_unique_id(df)
+
+    assert list(df_with_id["not_unique_id"]) == expected
+
+
+def test_add_not_unique_id_key():
+    data = {
+        "date": ["2023-01-01", "2023-01-01", "2023-01-02"],
+        "account": ["account1", "account1", "account2"],
+        "description": ["desc1", "desc1", "desc2"],
+        "info": ["info1", "info1", "info2"],
+        "amount_original": [100, 100, 200],
+        "row_type": ["type1", "type1", "type2"],
+        "source_file": ["file1", "file1", "file2"],
+        "owner": ["owner1", "owner1", "owner2"],
+    }
+
+    df_with_id = add_not_unique_id(pd.DataFrame(data))
+
+    assert df_with_id["id_key"].dtype == "int64"
+    assert df_with_id["id_key"].iloc[0] == df_with_id["id_key"].iloc[1]
+    assert df_with_id["id_key"].iloc[0] != df_with_id["id_key"].iloc[2]
+    # keys must not change between runs, final_data.csv ids are joined by key
+    assert df_with_id["id_key"].iloc[0] == -3700812557811868518
+    assert list(create_id_keys(df_with_id["not_unique_id"])) == list(
+        df_with_id["id_key"]
+    )
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -1,6 +1,11 @@
 import pytest
 import pandas as pd
-from data_pipeline.src.data_processing.s_07_fixer import apply_fixes
+from data_pipeline.src.data_processing.s_07_fixer import (
+    apply_fixes,
+    find_prefixes,
+    prefix_index,
+)
+from data_pipeline.src.utils.schema import apply_schema
 
 
 def test_apply_fixes():
@@ -191,5 +196,89 @@ def test_apply_fixes_with_failed_fixes():
     assert "1 fixes failed" in str(excinfo.value)
 
 
+def test_find_prefixes():
+    ids = pd.Series(["b2", "a1", "b1", "ab", "c\U0010ffffx", None])
+    index = prefix_index(ids)
+
+    positions, counts = find_prefixes(index, ["b", "a1", "ab", "x", "c\U0010ffff", ""])
+
+    # first matching row in row order
+    assert list(positions) == [0, 1, 3, -1, 4, 0]
+    assert list(counts) == [2, 1, 1, 0, 1, 6]
+
+
+def test_apply_fixes_multiple_matches(caplog):
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2023-01-31", "2023-01-31", "2023-02-28"]),
+            "description": ["a", "b", "c"],
+            "info": [None, None, None],
+            "amount": [1.0, 2.0, 3.0],
+            "class": ["menot", "menot", "menot"],
+            "category": ["ruoka", "ruoka", "ruoka"],
+            "sub_category": ["", "", ""],
+            "rule_id": ["1", "1", "1"],
+            "not_unique_id": ["20230131__a", "20230131__b", "20230228__c"],
+        }
+    )
+    fixes_df = pd.DataFrame(
+        {
+            "id": ["f1", "f2", None],
+            "transaction_id": ["20230131", "20230228", "20230228__c"],
+            "date": [None, None, None],
+            "description": ["fixed", "first", "second"],
+            "info": [None, None, None],
+            "amount": [None, None, None],
+            "class": ["tulot", None, ""],
+            "category": [None, None, None],
+            "sub_category": [None, None, None],
+        }
+    )
+
+    fixed_df = apply_fixes(df, fixes_df)
+
+    # only the first matching row is fixed and the prefix is reported
+    assert list(fixed_df["description"]) == ["fixed", "b", "second"]
+    assert list(fixed_df["class"]) == ["tulot", "menot", "menot"]
+    assert list(fixed_df["rule_id"]) == ["f1", "1", "f2"]
+    assert "20230131 (2 rows)" in caplog.text
+
+
+def test_apply_fixes_comma_decimal():
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2023-01-31", "2023-02-28"]),
+            "description": ["a", "b"],
+            "info": [None, None],
+            "amount": [1.0, 2.0],
+            "class": ["menot", "menot"],
+            "category": ["ruoka", "ruoka"],
+            "sub_category": ["", ""],
+            "rule_id": ["1", "1"],
+            "not_unique_id": ["20230131__a", "20230228__b"],
+        }
+    )
+    # fixes.csv is read as strings, amounts are written like in source files
+    fixes_df = pd.DataFrame(
+        {
+            "id": ["f1", "f2"],
+            "transaction_id": ["20230131__a", "20230228__b"],
+            "date": [None, None],
+            "description": [None, "fixed"],
+            "info": [None, None],
+            "amount": ["-12,5", ""],
+            "class": [None, None],
+            "category": [None, None],
+            "sub_category": [None, None],
+        },
+        dtype=str,
+    )
+
+    fixed_df = apply_schema(apply_fixes(df, fixes_df))
+
+    assert list(fixed_df["amount"]) == [-12.5, 2.0]
+    assert list(fixed_df["description"]) == ["a", "fixed"]
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -3,7 +3,12 @@ import os
 
 import pytest
 import pandas as pd
-from data_pipeline.src.data_processing.s_08_target_setter import set_targets
+from data_pipeline.src.data_processing.s_08_target_setter import (
+    format_target_amounts,
+    month_ends,
+    set_targets,
+)
+from data_pipeline.src.utils.schema import apply_schema
 
 
 def test_set_targets():
@@ -62,5 +67,65 @@ Säästötavoite 1,2023-01-01,2024-12-31,mkk,500,menot,,
     )
 
 
+def test_set_targets_comma_decimal():
+    # targets.csv is read as strings, amounts are written like in source files
+    df_targets = pd.DataFrame(
+        {
+            "target_name": ["Säästötavoite 1"],
+            "start": ["2023-01-01"],
+            "end": ["2023-02-28"],
+            "owner": ["mkk"],
+            "monthly_target_amount": ["1000,50"],
+            "class": ["tulot"],
+            "category": [None],
+            "sub_category": [None],
+        }
+    )
+
+    df_monthly_targets = apply_schema(set_targets(df_targets))
+
+    assert list(df_monthly_targets["amount"]) == [1000.5, 1000.5]
+    assert list(df_monthly_targets["amount_original"]) == [1000.5, 1000.5]
+    # the id keeps the amount as written
+    assert (
+        df_monthly_targets.loc[0, "not_unique_id"]
+        == "20230131__target__säästötavoite1__100050__target__mkk"
+    )
+
+
+def test_format_target_amounts():
+    df = pd.DataFrame(
+        {
+            "row_type": ["Actual", "Target", "Target"],
+            "amount_original": [3000.0, 1000.0, 1000.5],
+            "amount": [3000.0, -500.0, 1000.5],
+        }
+    )
+
+    # whole target amounts are written without decimals, other amounts as floats
+    csv = format_target_amounts(df).to_csv(index=False)
+    assert csv.splitlines()[1:] == [
+        "Actual,3000.0,3000.0",
+        "Target,1000,-500",
+        "Target,1000.5,1000.5",
+    ]
+
+
+def test_month_ends():
+    starts = pd.to_datetime(["2023-01-01", "2023-01-31", "2024-01-15", "2023-05-10"])
+    ends = pd.to_datetime(["2023-03-31", "2023-03-30", "2024-03-01", "2023-05-20"])
+
+    dates, counts = month_ends(pd.Series(starts), pd.Series(ends))
+
+    # same month ends as pd.date_range per target, one month less when the end date is before the month end
+    expected = [
+        pd.date_range(start=start, end=end, freq="M")
+        for start, end in zip(starts, ends)
+    ]
+    assert list(counts) == [3, 2, 2, 0]
+    assert list(dates) == [date for dates in expected for date in dates]
+    assert pd.Timestamp("2024-02-29") in list(dates)
+
+
 if __name__ == "__main__":
     pytest.main()